@@ -1,26 +1,340 @@
+import argparse
+import bisect
+import collections
 import csv
-import tkFileDialog
+import glob
+import gzip
+import hashlib
+import json
+import marshal
+import mmap
+import multiprocessing
 import os
 import os.path
 import re
+import shutil
+import signal
+import sqlite3
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 __author__ = 'Lincoln Lorscheider'
 
+_NAN = float('nan')
+
+# bump whenever a change to parsing would change the objects built from the same report, to invalidate ParseCache
+PARSER_VERSION = 3
+# bump whenever a TEC check changes the findings it reports, to invalidate stored incremental-analysis state
+RULES_VERSION = 2
+
+
+def _intern(value):
+    """interns repeated strings so marshal writes them once per record and loads them back shared"""
+    if type(value) is str:
+        return intern(value)
+    return value
+
+
+def _replace_file(temp_path, path):
+    """moves temp_path over path.  os.rename replaces path atomically on POSIX, so readers see the old file or the
+    new one and never neither; Windows won't rename onto an existing file, so there alone path is removed first"""
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(temp_path, path)
+
+
+# report text is bytes in whatever code page the front end used; latin-1 round-trips it through JSON
+def _json_dumps(value):
+    return json.dumps(value, encoding='latin-1')
+
+
+def _json_dump(value, json_file):
+    json.dump(value, json_file, encoding='latin-1')
+
+
+def _json_load(json_file):
+    """json.load, with every string turned back into the bytes _json_dump was given"""
+    return _latin1(json.load(json_file))
+
+
+def _latin1(value):
+    if isinstance(value, unicode):
+        return value.encode('latin-1')
+    if isinstance(value, list):
+        return [_latin1(item) for item in value]
+    if isinstance(value, dict):
+        return dict((_latin1(key), _latin1(item)) for key, item in value.iteritems())
+    return value
+
+
+def _save_json(path, value):
+    """writes value to path as JSON through a temporary file, replacing path in one step"""
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, 'wb') as json_file:
+        _json_dump(value, json_file)
+    _replace_file(temp_path, path)
+
+
+def _file_dialog():
+    """imports tkFileDialog on first use, so headless callers that always pass paths never load Tk"""
+    import tkFileDialog
+    return tkFileDialog
+
+
+class Metrics(object):
+    """Stage timings and event counters for a run.  Each stage keeps its call count, wall seconds and items handled;
+    a stage's seconds exclude the time spent in stages nested inside it (CSV rows read while TECs are built, rules run
+    while a TEC is analyzed), so the stage times of a run add up to its total.  Counters track rows parsed, TECs built
+    and failures emitted per rule.  While disabled, which is the default, instrumented code only pays
+    for a check of self.enabled.  The module-level instance sodda.metrics is the one the report classes record to."""
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.counters = collections.Counter()
+        self._children = []
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def begin(self):
+        self._children.append(0.0)
+        return time.time()
+
+    def end(self, stage, start, items=0):
+        elapsed = time.time() - start
+        nested = self._children.pop()
+        if self._children:
+            self._children[-1] += elapsed
+        record = self.stages.get(stage)
+        if record is None:
+            record = self.stages[stage] = {'calls': 0, 'seconds': 0.0, 'items': 0}
+        record['calls'] += 1
+        record['seconds'] += elapsed - nested
+        record['items'] += items
+
+    def count(self, counter, amount=1):
+        self.counters[counter] += amount
+
+    def iterate(self, stage, iterable, counter=None):
+        """yields from iterable, charging the time spent producing each item to stage and counting it"""
+        iterator = iter(iterable)
+        while True:
+            start = self.begin()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.end(stage, start)
+                return
+            except:
+                self.end(stage, start)
+                raise
+            self.end(stage, start, 1)
+            if counter is not None:
+                self.counters[counter] += 1
+            yield item
+
+    def rule(self, tec, rule):
+        """runs the named TEC check, timing it and counting the failures it appends"""
+        before = len(tec.failures)
+        start = self.begin()
+        try:
+            return getattr(tec, rule)()
+        finally:
+            self.end("rule." + rule, start, 1)
+            self.counters["failures." + rule] += len(tec.failures) - before
+
+    def merge(self, snapshot):
+        """adds a snapshot() taken elsewhere, such as in a batch worker process, into these totals"""
+        for stage, other in snapshot['stages'].items():
+            record = self.stages.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'items': 0})
+            for field in ('calls', 'seconds', 'items'):
+                record[field] += other[field]
+        self.counters.update(snapshot['counters'])
+
+    def snapshot(self):
+        return {'stages': dict((stage, dict(record)) for stage, record in self.stages.items()),
+                'counters': dict(self.counters)}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        lines = []
+        for field, kind, text in (('seconds', 'seconds', "Wall seconds spent in the stage, excluding nested stages"),
+                                  ('calls', 'calls', "Times the stage ran"),
+                                  ('items', 'items', "Items the stage handled")):
+            metric = "sodda_stage_{}_total".format(kind)
+            lines.append("# HELP {} {}".format(metric, text))
+            lines.append("# TYPE {} counter".format(metric))
+            for stage in sorted(self.stages):
+                lines.append('{}{{stage="{}"}} {!r}'.format(metric, stage, self.stages[stage][field]))
+        lines.append("# HELP sodda_events_total Rows parsed, objects built and failures emitted per rule")
+        lines.append("# TYPE sodda_events_total counter")
+        for counter in sorted(self.counters):
+            lines.append('sodda_events_total{{event="{}"}} {}'.format(counter, self.counters[counter]))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """writes the totals to path, as Prometheus text if it ends in .prom and as JSON otherwise"""
+        with open(path, 'w') as metrics_file:
+            if path.endswith(".prom"):
+                metrics_file.write(self.to_prometheus())
+            else:
+                metrics_file.write(self.to_json())
+
+
+metrics = Metrics()
+
+
+def _timed_stage(stage, items=None):
+    """decorates a report method so that, while metrics is enabled, its calls are recorded as stage, with items(self)
+    as the number of items handled"""
+    def decorate(method):
+        def wrapper(self, *args, **kwargs):
+            if not metrics.enabled:
+                return method(self, *args, **kwargs)
+            start = metrics.begin()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                metrics.end(stage, start, items(self) if items is not None else 0)
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+    return decorate
+
+
+def _run_rule(tec, rule):
+    return getattr(tec, rule)()
+
+
+class MappedLines(object):
+    """Iterates the lines of a file, newlines included, through a read-only memory map, so they are handed out one at
+    a time without the file being copied into memory.  offset is the byte offset at which the line most recently handed
+    out starts, for error messages.  start and end optionally limit iteration to the lines starting in that byte range.
+    The map and file are closed as soon as the last line has been read, or by close()"""
+
+    def __init__(self, path, start=0, end=None):
+        self.path = path
+        self.offset = start
+        self._file = open(path, 'rb')
+        self._map = None
+        size = os.fstat(self._file.fileno()).st_size
+        self._end = size if end is None else min(end, size)
+        if size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._map.seek(start)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._map is None:
+            self.close()
+            raise StopIteration
+        self.offset = self._map.tell()
+        if self.offset >= self._end:
+            self.close()
+            raise StopIteration
+        line = self._map.readline()
+        if not line:
+            self.close()
+            raise StopIteration
+        return line
+
+    def head(self, size):
+        """the first size bytes of the file, read from the map without moving the iteration position"""
+        if self._map is None:
+            return ''
+        return self._map[:size]
+
+    def with_offsets(self):
+        """yields (byte offset, line) for each remaining line"""
+        for line in self:
+            yield self.offset, line
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReportParseError(ValueError):
+    """A report line that its parser couldn't make sense of, located by byte offset"""
+
+    def __init__(self, report_path, offset, error):
+        super(ReportParseError, self).__init__("{} at byte {}: {}: {}".format(report_path, offset,
+                                                                          type(error).__name__, error))
+        self.report_path = report_path
+        self.offset = offset
 
 
 class Report(object):
-    """ Report class opens a .csv file path and reads it into the Report.data attribute, which is a csv.reader instance
-     unless the file was a .txt file, in which case it's a list"""
-    def __init__(self, report_path=None):
-        """A class that opens csv reports and reads them into memory"""
+    """ Report class opens a report file path and reads it into the Report.data attribute, which is a csv.reader over
+     the file's MappedLines for report types registered as 'csv', or the MappedLines themselves for 'lines' types"""
+    def __init__(self, report_path=None, cache=None, lines=None):
+        """A class that opens csv reports and reads them into memory.  If a ParseCache is given and already holds this
+        report, self._cached iterates the cached records and the file itself is not read.  lines optionally hands over
+        the report's MappedLines already opened by the caller, as open_report does after sniffing them"""
         if report_path is None:
-            report_path = tkFileDialog.askopenfilename(title="Select the Application Subpoint Report you wish to analyze")
+            report_path = _file_dialog().askopenfilename(title="Select the Application Subpoint Report you wish to analyze")
         self.report_path = report_path
         self.report_file_extension = os.path.split(self.report_path)[1]
-        if self.report_file_extension.endswith(".txt"):
-            self.data = list(open(self.report_path))
+        # the registered name of this report's type, filled in by open_report
+        self.report_type = None
+        self.cache = cache
+        self._cache_key = None
+        self._cached = None
+        self._lines = None
+        self._given_lines = lines
+        if cache is not None:
+            self._cache_key = cache.key(self.report_path, self._cache_kind())
+            self._cached = cache.records(self._cache_key)
+        if self._cached is not None:
+            self.data = []
+            if lines is not None:
+                lines.close()
+        elif self._report_format() == 'lines':
+            self.data = self._open_lines()
+            if metrics.enabled:
+                self.data = metrics.iterate('load_txt', self.data, 'lines_read')
         else:
             self.load_csv(report_path)
+            if metrics.enabled:
+                self.data = metrics.iterate('load_csv', self.data, 'rows_parsed')
+
+    def _cache_kind(self):
+        """distinguishes this report's ParseCache entries from other parsers' entries for the same file"""
+        return type(self).__name__
+
+    def _report_format(self):
+        """'csv' or 'lines', as registered for this report's type; a Report subclass that was never registered is
+        read by its file extension, .txt as lines"""
+        for report_type in REPORT_REGISTRY.values():
+            if report_type.report_class is type(self):
+                return report_type.format
+        return 'lines' if self.report_file_extension.endswith(".txt") else 'csv'
 
     def load_csv(self, filepath=None):
         if filepath is not None:
@@ -28,74 +342,451 @@ class Report(object):
                 self.report_path = filepath
             else:
                 return InvalidFilePath
-        reader = csv.reader(open(self.report_path,'rb'))
+        reader = csv.reader(self._open_lines())
         self.data = reader
 
+    def _open_lines(self):
+        """returns the report's MappedLines: those handed to the constructor if they are for this file, else new ones"""
+        lines, self._given_lines = self._given_lines, None
+        if lines is None or lines.path != self.report_path:
+            if lines is not None:
+                lines.close()
+            lines = MappedLines(self.report_path)
+        self._lines = lines
+        return lines
+
+    def offset(self):
+        """byte offset of the report line most recently read, or None if the report isn't being read from its file"""
+        if self._lines is None:
+            return None
+        return self._lines.offset
+
+    def close(self):
+        """closes the report file if it is still open; parsers that read it to the end have already done so"""
+        if self._lines is not None:
+            self._lines.close()
+
 
 class SubpointReport(Report):
     """Inherits from Report.  Populates and Exposes a list of TEC objects from the application subpoint report it takes as its input."""
-    def __init__(self, report_path=None):
-        super(SubpointReport, self).__init__(report_path)
+    def __init__(self, report_path=None, stream=False, outfile=None, cache=None, previous=None, lines=None,
+                 analyze=True, workers=None):
+        """analyze=False only opens the report, leaving its TECs to be read through iter_TECs or iter_points.  workers
+        greater than one analyzes the report in chunks on that many processes, see parallel_analysis"""
+        if analyze and workers is not None and workers > 1:
+            # parallel_analysis reads the file itself, so don't hash all of it for a cache key it won't use
+            cache = None
+        super(SubpointReport, self).__init__(report_path, cache, lines)
         self.TECs = []
         self._headers = []
-        self.failures = []
-        self.create_TECs()
-        self.analyze_tecs()
-        self.dump_analysis()
+        self.failure_count = 0
+        self.delta = {}
+        self.reanalyzed = 0
+        self._state = None
+        if not analyze:
+            return
+        if previous is not None and (stream or (workers is not None and workers > 1)):
+            raise ValueError("Incremental analysis against previous can't be combined with stream or workers")
+        if workers is not None and workers > 1:
+            self.parallel_analysis(outfile, workers)
+        elif stream:
+            self.stream_analysis(outfile)
+        elif previous is not None:
+            self.create_TECs()
+            self.analyze_incremental(previous, save=False)
+            self.dump_delta(outfile)
+            self.save_state(previous)
+        else:
+            self.create_TECs()
+            self.analyze_tecs()
+            self.dump_analysis(outfile)
 
     def create_TECs(self):
         """populates self.TECs with the devices defined in the report"""
+        for tec in self.iter_TECs():
+            self.TECs.append(tec)
+
+    def iter_TECs(self):
+        """yields each TEC defined in the report as soon as the row that closes its block has been read, so only one
+        controller is held in memory at a time.  With a cache, TECs come from it on a hit and are written to it on a miss"""
+        tecs = self._load_TECs()
+        if metrics.enabled:
+            tecs = metrics.iterate('create_TECs', tecs, 'tecs_built')
+        return tecs
+
+    def iter_points(self):
+        """yields every subpoint of every TEC, reading the TECs as they are needed"""
+        for tec in self.iter_TECs():
+            for point in tec.subpoints:
+                yield point
+
+    def _load_TECs(self):
+        if self._cached is not None:
+            for record in self._cached:
+                yield TEC.from_record(record)
+            return
+        if self.cache is None:
+            for tec in self._parse_TECs():
+                yield tec
+            return
+        writer = self.cache.writer(self._cache_key)
+        try:
+            for tec in self._parse_TECs():
+                writer.write(tec.to_record())
+                yield tec
+            writer.commit()
+        finally:
+            writer.discard()
+
+    def _parse_TECs(self):
         tec = None
         for row in self.data:
             if len(row) > 1:
                 if row[0] == "TEC System Name:":
                     if tec is not None:
-                        self.TECs.append(tec)
+                        yield tec
                     tec = TEC(row[1])
                     tec.descriptor = row[4]
                 else:
-                    subpoint = Point()
-                    subpoint.name = row[1].split(":")[1].strip()
-                    if subpoint.name == "ADDRESS":
-                        subpoint.address = 1
-                    else:
-                        subpoint.address = int(row[0].strip())
-                    subpoint.device = tec.name
-                    if subpoint.name == "APPLICATION":
-                        subpoint.value = int(float(row[4]))
-                        tec.application = int(float(row[4]))
-                    else:
-                        subpoint.value = row[4]
-                    subpoint.units = row[5]
-                    subpoint.status, subpoint.priority = row[6].split("    ")
-                    subpoint.priority = subpoint.priority.strip()
-                    subpoint.status = subpoint.status.strip()
-                    tec.subpoints.append(subpoint)
+                    try:
+                        tec.add_subpoint(self._parse_subpoint(row, tec))
+                    except (AttributeError, IndexError, ValueError) as error:
+                        raise ReportParseError(self.report_path, self.offset(), error)
             else:
                 if len(row[0].split("**********"))>1:
-                    self.TECs.append(tec)
+                    self.close()
+                    yield tec
                     break
+        else:
+            # a report cut short of its end marker, or a chunk of one, still yields its last TEC
+            if tec is not None:
+                yield tec
 
-    def analyze_tecs(self):
-        self.failures = []
+    @staticmethod
+    def _parse_subpoint(row, tec):
+        subpoint = Point()
+        subpoint.name = intern(row[1].split(":")[1].strip())
+        if subpoint.name == "ADDRESS":
+            subpoint.address = 1
+        else:
+            subpoint.address = int(row[0].strip())
+        subpoint.device = tec.name
+        if subpoint.name == "APPLICATION":
+            subpoint.value = int(float(row[4]))
+            tec.application = int(float(row[4]))
+        else:
+            subpoint.value = row[4]
+        subpoint.units = intern(row[5])
+        status, priority = row[6].split("    ")
+        subpoint.status = intern(status.strip())
+        subpoint.priority = intern(priority.strip())
+        return subpoint
+
+    @_timed_stage('analyze_tecs', lambda self: len(self.TECs))
+    def analyze_tecs(self, writer=None):
+        """analyzes every TEC in self.TECs, leaving its findings on the TEC and handing it to writer, a FailureWriter,
+        as soon as it is done"""
+        self.failure_count = 0
         for tec in self.TECs:
             self._headers.append(tec.name)
-            for index, failure in enumerate(tec.analyze()):
-                try:
-                    self.failures[index][tec.name] = failure
-                except IndexError:
-                    self.failures.append({tec.name: failure})
+            self.failure_count += len(tec.analyze())
+            if writer is not None:
+                writer.write_tec(tec)
 
-    def dump_analysis(self):
-        outfile = tkFileDialog.asksaveasfile()
+    @_timed_stage('analyze_incremental', lambda self: len(self.TECs))
+    def analyze_incremental(self, state_path, save=True):
+        """Like analyze_tecs, but only re-runs TEC.analyze on controllers whose subpoints changed since the run that
+        wrote state_path; the rest reuse their stored failures.  Fills self.delta with 'new', 'cleared' and
+        'unchanged' lists of (TEC name, failure) and, if save, rewrites state_path for the next run.  Callers that write
+        the delta out should pass save=False and call save_state once it is written, so a delta that fails to write
+        isn't lost to the next run"""
+        previous = {}
+        if os.path.exists(state_path):
+            with open(state_path, 'rb') as state_file:
+                state = _json_load(state_file)
+            if state.get('rules_version') == RULES_VERSION:
+                previous = state['tecs']
+        current = {}
+        self.failure_count = 0
+        self.delta = {'new': [], 'cleared': [], 'unchanged': []}
+        self.reanalyzed = 0
+        for tec in self.TECs:
+            self._headers.append(tec.name)
+            fingerprint = tec.fingerprint()
+            old_fingerprint, old_failures, old_rules = previous.pop(tec.name, (None, [], []))
+            if fingerprint == old_fingerprint:
+                tec.failures = list(old_failures)
+                tec.failure_rules = list(old_rules)
+            else:
+                tec.analyze()
+                self.reanalyzed += 1
+            current[tec.name] = (fingerprint, tec.failures, tec.failure_rules)
+            self.failure_count += len(tec.failures)
+            remaining = collections.Counter(old_failures)
+            for failure in tec.failures:
+                if remaining[failure] > 0:
+                    remaining[failure] -= 1
+                    self.delta['unchanged'].append((tec.name, failure))
+                else:
+                    self.delta['new'].append((tec.name, failure))
+            for failure in remaining.elements():
+                self.delta['cleared'].append((tec.name, failure))
+        for name, (_, old_failures, _) in sorted(previous.items()):
+            for failure in old_failures:
+                self.delta['cleared'].append((name, failure))
+        self._state = {'rules_version': RULES_VERSION, 'tecs': current}
+        if save:
+            self.save_state(state_path)
+        return self.delta
+
+    def save_state(self, state_path):
+        """writes the state analyze_incremental built to state_path, for the next run to compare against"""
+        _save_json(state_path, self._state)
+
+    @_timed_stage('dump_analysis')
+    def dump_analysis(self, outfile=None):
+        """writes the findings of the analyzed TECs to outfile, a path, open file or FailureWriter"""
+        writer, owned = self._failure_writer(outfile)
+        try:
+            for tec in self.TECs:
+                writer.write_tec(tec)
+        finally:
+            if owned:
+                writer.close()
+            else:
+                writer.flush()
+
+    def dump_delta(self, outfile=None):
+        """writes self.delta to outfile, a path or open file, as (change, TEC name, failure) rows"""
+        if outfile is None:
+            outfile = _file_dialog().asksaveasfile()
+        if isinstance(outfile, basestring):
+            with open(outfile, 'wb') as delta_file:
+                return self.dump_delta(delta_file)
         writer = csv.writer(outfile, lineterminator='\n')
-        for items in self.failures:
-            for k,v in items.items():
-                writer.writerow([k,v])
+        for change in ('new', 'cleared', 'unchanged'):
+            for name, failure in self.delta.get(change, []):
+                writer.writerow([change, name, failure])
+
+    @_timed_stage('stream_analysis', lambda self: len(self._headers))
+    def stream_analysis(self, outfile=None):
+        """analyzes each TEC as iter_TECs yields it and writes its findings straight to outfile, a path, open file or
+        FailureWriter.  self.TECs is not populated, so memory stays bounded by one controller"""
+        writer, owned = self._failure_writer(outfile)
+        try:
+            for tec in self.iter_TECs():
+                self._headers.append(tec.name)
+                self.failure_count += len(tec.analyze())
+                writer.write_tec(tec)
+        finally:
+            if owned:
+                writer.close()
+            else:
+                writer.flush()
+
+    @_timed_stage('parallel_analysis', lambda self: len(self._headers))
+    def parallel_analysis(self, outfile=None, workers=None):
+        """Like stream_analysis, but the report is split into byte ranges that each start at a "TEC System Name:" row,
+        found by a pre-scan of the memory-mapped file, and the ranges are parsed and analyzed on a pool of workers
+        processes (one per core by default).  Findings are written in the order analyze_tecs would produce them, as
+        each range in turn finishes.  The file itself is read, not the ParseCache"""
+        self.close()
+        writer, owned = self._failure_writer(outfile)
+        try:
+            for name, descriptor, failures, rules in _analyze_subpoint_chunks(self.report_path, workers):
+                tec = TEC(name)
+                tec.descriptor = descriptor
+                tec.failures = failures
+                tec.failure_rules = rules
+                self._headers.append(name)
+                self.failure_count += len(failures)
+                writer.write_tec(tec)
+        finally:
+            if owned:
+                writer.close()
+            else:
+                writer.flush()
+
+    @staticmethod
+    def _failure_writer(outfile):
+        """returns (writer, whether the caller should close it) for outfile, asking for a file if it is None"""
+        if isinstance(outfile, FailureWriter):
+            return outfile, False
+        if outfile is None:
+            outfile = _file_dialog().asksaveasfile()
+        return FailureWriter(outfile), True
+
+
+def find_tec_boundaries(report_path):
+    """byte offsets of the rows of a Subpoint report that open a TEC block, found by searching its memory map"""
+    marker = "TEC System Name:"
+    offsets = []
+    with open(report_path, 'rb') as report_file:
+        if not os.fstat(report_file.fileno()).st_size:
+            return offsets
+        mapped = mmap.mmap(report_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            position = mapped.find(marker)
+            while position != -1:
+                line_start = mapped.rfind("\n", 0, position) + 1
+                if mapped[line_start:position] in ('', '"'):
+                    offsets.append(line_start)
+                position = mapped.find(marker, position + len(marker))
+        finally:
+            mapped.close()
+    return offsets
+
+
+def split_subpoint_report(report_path, chunks, min_bytes=1 << 20):
+    """[(start, end)] byte ranges covering the report, about equal in size, no smaller than min_bytes where possible
+    and at most chunks of them, each but the first starting at a TEC block"""
+    size = os.path.getsize(report_path)
+    chunks = max(1, min(chunks, size // max(min_bytes, 1)))
+    boundaries = find_tec_boundaries(report_path)
+    starts = [0]
+    for number in range(1, chunks):
+        index = bisect.bisect_left(boundaries, size * number // chunks)
+        if index < len(boundaries) and boundaries[index] > starts[-1]:
+            starts.append(boundaries[index])
+    return zip(starts, starts[1:] + [size])
+
+
+def _analyze_subpoint_chunk(job):
+    """parses and analyzes the TECs in one byte range of a Subpoint report, returning what FailureWriter needs of each
+    and, when instrumented, the worker's metrics snapshot for the parent process to total"""
+    global metrics
+    report_path, start, end, instrumented = job
+    if not instrumented:
+        return _analyze_byte_range(report_path, start, end), None
+    outer = metrics
+    metrics = Metrics()
+    metrics.enable()
+    try:
+        return _analyze_byte_range(report_path, start, end), metrics.snapshot()
+    finally:
+        metrics = outer
+
+
+def _analyze_byte_range(report_path, start, end):
+    report = SubpointReport(report_path, lines=MappedLines(report_path, start, end), analyze=False)
+    results = []
+    for tec in report.iter_TECs():
+        tec.analyze()
+        results.append((tec.name, tec.descriptor, tec.failures, tec.failure_rules))
+    return results
+
+
+def _analyze_subpoint_chunks(report_path, workers=None, min_bytes=1 << 20):
+    """yields (name, descriptor, failures, rules) for every TEC in the report, in report order, analyzing four byte
+    ranges of at least min_bytes per worker process so a slow range doesn't hold the others up"""
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    ranges = split_subpoint_report(report_path, workers * 4, min_bytes)
+    if workers > 1 and len(ranges) > 1:
+        jobs = [(report_path, start, end, metrics.enabled) for start, end in ranges]
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        try:
+            for results, snapshot in pool.imap(_analyze_subpoint_chunk, jobs):
+                if snapshot is not None:
+                    metrics.merge(snapshot)
+                for result in results:
+                    yield result
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for start, end in ranges:
+            for result in _analyze_byte_range(report_path, start, end):
+                yield result
+
+
+class _Lines(list):
+    """a list of strings that csv.writer can write rows into"""
+    write = list.append
+
+
+class FailureWriter(object):
+    """Streams TEC findings to a file as one (TEC, descriptor, rule, message) record per failure, either as CSV with a
+    header row or as JSON Lines, optionally gzipped.  Records are rendered into a buffer that is written out every
+    buffer_records records, so each record costs the same and at most one buffer is held in memory.  target is a path
+    or an open file; for a path, format and compress default from its extension (.csv or .jsonl, then .gz).  fields
+    optionally renames the four columns, for findings about something other than TECs"""
+
+    fields = ('tec', 'descriptor', 'rule', 'message')
+    formats = ('csv', 'jsonl')
+
+    def __init__(self, target, format=None, compress=None, buffer_records=4096, fields=None):
+        name = target if isinstance(target, basestring) else getattr(target, 'name', '')
+        if not isinstance(name, basestring):
+            name = ''
+        if compress is None:
+            compress = name.endswith(".gz")
+        if format is None:
+            format = 'jsonl' if name.replace(".gz", "").endswith((".jsonl", ".json")) else 'csv'
+        if format not in self.formats:
+            raise ValueError("Unknown failure format {}".format(format))
+        if fields is not None:
+            if len(fields) != len(self.fields):
+                raise ValueError("FailureWriter takes {} field names, not {}".format(len(self.fields), len(fields)))
+            self.fields = tuple(fields)
+        self.format = format
+        self.count = 0
+        self.buffer_records = buffer_records
+        self._closing = []
+        if isinstance(target, basestring):
+            target = open(target, 'wb')
+            self._closing.append(target)
+        if compress:
+            target = gzip.GzipFile(fileobj=target, mode='wb')
+            self._closing.insert(0, target)
+        self._file = target
+        self._lines = _Lines()
+        self._csv = csv.writer(self._lines, lineterminator='\n')
+        if format == 'csv':
+            self._csv.writerow(self.fields)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, tec_name, descriptor, rule, message):
+        if self.format == 'csv':
+            self._csv.writerow((tec_name, descriptor, rule, message))
+        else:
+            record = collections.OrderedDict(zip(self.fields, (tec_name, descriptor, rule, message)))
+            self._lines.append(_json_dumps(record) + "\n")
+        self.count += 1
+        if len(self._lines) >= self.buffer_records:
+            self.flush()
+
+    def write_tec(self, tec):
+        """writes a record for each of tec's failures, with the rule that found it ('' if that isn't known)"""
+        rules = tec.failure_rules
+        for index, message in enumerate(tec.failures):
+            self.write(tec.name, tec.descriptor, rules[index] if index < len(rules) else '', message)
+
+    def flush(self):
+        if self._lines:
+            self._file.write("".join(self._lines))
+            del self._lines[:]
+
+    def close(self):
+        """flushes the buffer and closes what this writer opened; a file passed in is left open"""
+        if self._file is None:
+            return
+        self.flush()
+        for opened in self._closing:
+            opened.close()
+        self._file = None
 
 
 class TEC(object):
 
+    # the checks analyze runs, in order, once is_failed has found the controller communicating
+    rules = ('check_sensors', 'check_dampers', 'compare_temp_to_setpoint', 'compare_flow_to_setpoint', 'sanity_check')
+
     def __init__(self, name):
         self.name = name
         self.descriptor =''
@@ -103,30 +794,111 @@ class TEC(object):
         self.subpoints=[]
         self.status = ''
         self.failures = []
+        self.failure_rules = []
+        self.points = {}
+        self._indexed = 0
+        self._sensor_points = []
+        self._airflow_points = []
+        self._damper_points = []
+        self._auto_points = []
 
     def __repr__(self):
         return self.name
 
+    def fingerprint(self):
+        """SHA-1 over the name, value, status and priority of every subpoint, which is everything analyze looks at"""
+        digest = hashlib.sha1(self.name)
+        for point in self.subpoints:
+            digest.update("\x1e{}\x1f{}\x1f{}\x1f{}".format(point.name, point.value, point.status, point.priority))
+        return digest.hexdigest()
+
+    def to_record(self):
+        """flattens the TEC and its subpoints into builtins for ParseCache"""
+        return (self.name, self.descriptor, self.application, self.status,
+                [point.to_record() for point in self.subpoints])
+
+    @classmethod
+    def from_record(cls, record):
+        name, descriptor, application, status, subpoints = record
+        tec = cls(name)
+        tec.descriptor = descriptor
+        tec.application = application
+        tec.status = status
+        for point_record in subpoints:
+            tec.add_subpoint(Point.from_record(point_record))
+        return tec
+
+    def add_subpoint(self, point):
+        """appends point to self.subpoints and files it in the name index and rule buckets the checks run from"""
+        self.subpoints.append(point)
+        self._index(point)
+
+    def reindex(self):
+        """rebuilds the name index and rule buckets from self.subpoints, for TECs whose subpoints were set directly"""
+        self.points = {}
+        self._indexed = 0
+        self._sensor_points = []
+        self._airflow_points = []
+        self._damper_points = []
+        self._auto_points = []
+        for point in self.subpoints:
+            self._index(point)
+
+    def _index(self, point):
+        name = point.name
+        self.points[name] = point
+        self._indexed += 1
+        if "AIR VOL" in name:
+            self._airflow_points.append(point)
+            self._sensor_points.append(point)
+        elif name == "ROOM TEMP":
+            self._sensor_points.append(point)
+        if "DMP" in name and (name.endswith("CMD") or name.endswith("COMD")):
+            self._damper_points.append(point)
+        if name == "CTL STPT" or "LOOPOUT" in name:
+            self._auto_points.append(point)
+
     def analyze(self):
+        if metrics.enabled:
+            start = metrics.begin()
+            try:
+                return self._analyze(metrics.rule)
+            finally:
+                metrics.end('analyze', start, 1)
+        return self._analyze(_run_rule)
+
+    def _analyze(self, run):
+        """runs the checks in order through run(tec, rule name), skipping the rest if the controller has failed"""
         if str(self.application).endswith("90") or str(self.application).endswith("91") or str(self.application).endswith("92"):
             self.failures.append("This device is in slave mode")
-        if self.is_failed() is False:
-            self.check_sensors()
-            self.check_dampers()
-            self.compare_temp_to_setpoint()
-            self.compare_flow_to_setpoint()
-            self.sanity_check()
+            self.failure_rules.append("slave_mode")
+            if metrics.enabled:
+                metrics.count("failures.slave_mode")
+        if self._indexed != len(self.subpoints):
+            self.reindex()
+        if self._check(run, 'is_failed') is False:
+            for rule in self.rules:
+                self._check(run, rule)
         return self.failures
 
+    def _check(self, run, rule):
+        """runs one check, noting it in self.failure_rules against each failure it appends"""
+        before = len(self.failures)
+        result = run(self, rule)
+        self.failure_rules.extend([rule] * (len(self.failures) - before))
+        return result
+
+    def _value_of(self, name):
+        """returns the float value of the named subpoint, or None if this TEC doesn't have one"""
+        point = self.points.get(name)
+        if point is None:
+            return None
+        return float(point.value)
+
     def compare_temp_to_setpoint(self, differential=5): #Todo Finish this
-        room_temp = None
-        temp_stpt = None
         failure = []
-        for point in self.subpoints:
-            if point.name == "CTL TEMP":
-                room_temp = float(point.value)
-            if point.name == "CTL STPT":
-                temp_stpt = float(point.value)
+        room_temp = self._value_of("CTL TEMP")
+        temp_stpt = self._value_of("CTL STPT")
         if room_temp is not None and temp_stpt is not None:
             if abs(temp_stpt - room_temp) >= differential:
                 failure.append("Temperature Control Failure, CTL TEMP is currently {} degrees from CTL STPT".format(temp_stpt-room_temp))
@@ -136,17 +908,8 @@ class TEC(object):
 
     def compare_flow_to_setpoint(self, differential=25):
         failure = []
-        air_volume = None
-        flow_setpoint_pct = None
-        occupance = None
-        min_flow = None
-        max_flow = None
-        flow_pct = None
-        for point in self.subpoints:
-            if point.name == "FLOW":
-                flow_pct = float(point.value)
-            if point.name == "FLOW STPT":
-                flow_setpoint_pct = float(point.value)
+        flow_pct = self._value_of("FLOW")
+        flow_setpoint_pct = self._value_of("FLOW STPT")
         if flow_setpoint_pct is not None and flow_pct is not None:
             delta = flow_setpoint_pct - flow_pct
             if abs(delta) > differential:
@@ -157,13 +920,9 @@ class TEC(object):
 
     def check_sensors(self):
         failure = []
-        for point in self.subpoints:
-            if "AIR VOL" in point.name:
-                if point.status == Point.failed:
-                    failure.append("The {} sensor is Failed".format(point.name))
-            if point.name == "ROOM TEMP":
-                if point.status == Point.failed:
-                    failure.append("The {} sensor is Failed".format(point.name))
+        for point in self._sensor_points:
+            if point.status == Point.failed:
+                failure.append("The {} sensor is Failed".format(point.name))
         if len(failure) > 0:
             self.failures.extend(failure)
             return True
@@ -174,14 +933,13 @@ class TEC(object):
         failure = []
         airflows = {}
         damper_positions = {}
-        for point in self.subpoints:
-            if "AIR VOL" in point.name:
-                airflows[point.name.replace("AIR VOL", "")] = float(point.value)
-            if "DMP" in point.name and (point.name.endswith("CMD") or point.name.endswith("COMD")):
-                if point.name == "DMPR COMD":
-                    damper_positions["UME"] = float(point.value)
-                else:
-                    damper_positions[point.name.replace("DMP CMD", "")] = float(point.value)
+        for point in self._airflow_points:
+            airflows[point.name.replace("AIR VOL", "")] = float(point.value)
+        for point in self._damper_points:
+            if point.name == "DMPR COMD":
+                damper_positions["UME"] = float(point.value)
+            else:
+                damper_positions[point.name.replace("DMP CMD", "")] = float(point.value)
         for duct, airflow in airflows.items():
             dmpr_position = damper_positions[duct]
             if dmpr_position == 0 and airflow > 10:
@@ -198,16 +956,11 @@ class TEC(object):
 
     def sanity_check(self):
         failure = []
-        occ_flow = None
-        unocc_flow = None
-        for point in self.subpoints:
-            if point.name == "OCC FLOW":
-                occ_flow = float(point.value)
-            if point.name == "UNOCC FLOW":
-                unocc_flow = float(point.value)
-            if point.name == "CTL STPT" or "LOOPOUT" in point.name:
-                if point.priority != "NONE":
-                    failure.append("{} Not in Automatic - Automatic operation of this point is essential for proper operation".format(point.name))
+        occ_flow = self._value_of("OCC FLOW")
+        unocc_flow = self._value_of("UNOCC FLOW")
+        for point in self._auto_points:
+            if point.priority != "NONE":
+                failure.append("{} Not in Automatic - Automatic operation of this point is essential for proper operation".format(point.name))
         if occ_flow is not None and unocc_flow is not None:
             if occ_flow == 0:
                 failure.append("Occ flow setpoint - The occupied mode has an airflow setpoint of zero")
@@ -220,18 +973,146 @@ class TEC(object):
 
     def is_failed(self):
         failure = []
-        for point in self.subpoints:
-            if point.name == "APPLICATION" and point.status == Point.failed:
-                failure.append("NOT COMMUNICATING - {} controller may be broken".format(point.device))
-                self.failures.extend(failure)
-                return True
+        point = self.points.get("APPLICATION")
+        if point is not None and point.status == Point.failed:
+            failure.append("NOT COMMUNICATING - {} controller may be broken".format(point.device))
+            self.failures.extend(failure)
+            return True
         return False
 
 
+class FaultEngine(object):
+    """Columnar equivalent of TEC.analyze for a whole building.  The TECs are laid out as one row per controller and one
+    column per well-known point (NaN where the controller doesn't have it), with the variable-length sensor, damper and
+    automatic-priority subpoints held as parallel (row, value) arrays, so each rule is a single NumPy mask over every
+    TEC at once.  Values that won't convert to float are NaN and, like a missing damper command, simply never fire."""
+
+    columns = ("CTL TEMP", "CTL STPT", "FLOW", "FLOW STPT", "OCC FLOW", "UNOCC FLOW")
+
+    def __init__(self, tecs):
+        if numpy is None:
+            raise ImportError("FaultEngine requires numpy")
+        self.names = []
+        self._devices = []
+        applications = []
+        failed = []
+        values = []
+        sensor_rows, sensor_failed, self._sensor_names = [], [], []
+        damper_rows, damper_positions, damper_airflows = [], [], []
+        auto_rows, auto_manual, self._auto_names = [], [], []
+        for row, tec in enumerate(tecs):
+            if tec._indexed != len(tec.subpoints):
+                tec.reindex()
+            self.names.append(tec.name)
+            applications.append(tec.application if isinstance(tec.application, (int, long, float)) else _NAN)
+            app_point = tec.points.get("APPLICATION")
+            failed.append(app_point is not None and app_point.status == Point.failed)
+            self._devices.append(app_point.device if app_point is not None else '')
+            values.append([self._as_float(tec.points[name].value) if name in tec.points else _NAN
+                           for name in self.columns])
+            for point in tec._sensor_points:
+                sensor_rows.append(row)
+                sensor_failed.append(point.status == Point.failed)
+                self._sensor_names.append(point.name)
+            airflows = {}
+            positions = {}
+            for point in tec._airflow_points:
+                airflows[point.name.replace("AIR VOL", "")] = self._as_float(point.value)
+            for point in tec._damper_points:
+                if point.name == "DMPR COMD":
+                    positions["UME"] = self._as_float(point.value)
+                else:
+                    positions[point.name.replace("DMP CMD", "")] = self._as_float(point.value)
+            for duct, airflow in airflows.items():
+                damper_rows.append(row)
+                damper_positions.append(positions.get(duct, _NAN))
+                damper_airflows.append(airflow)
+            for point in tec._auto_points:
+                auto_rows.append(row)
+                auto_manual.append(point.priority != "NONE")
+                self._auto_names.append(point.name)
+        self.application = numpy.array(applications, dtype=float)
+        self.failed = numpy.array(failed, dtype=bool)
+        self.values = numpy.array(values, dtype=float).reshape(len(self.names), len(self.columns))
+        self.sensor_rows = numpy.array(sensor_rows, dtype=int)
+        self.sensor_failed = numpy.array(sensor_failed, dtype=bool)
+        self.damper_rows = numpy.array(damper_rows, dtype=int)
+        self.damper_positions = numpy.array(damper_positions, dtype=float)
+        self.damper_airflows = numpy.array(damper_airflows, dtype=float)
+        self.auto_rows = numpy.array(auto_rows, dtype=int)
+        self.auto_manual = numpy.array(auto_manual, dtype=bool)
+
+    @staticmethod
+    def _as_float(value):
+        try:
+            return float(value)
+        except ValueError:
+            return _NAN
+
+    def column(self, name):
+        return self.values[:, self.columns.index(name)]
+
+    def analyze(self, temp_differential=5, flow_differential=25):
+        """evaluates every rule across the building and returns [(TEC name, failures)] in the order the TECs were given,
+        each failures list matching what TEC.analyze returns for that controller"""
+        findings = [[] for _ in self.names]
+        with numpy.errstate(invalid='ignore'):
+            slave = numpy.in1d(numpy.mod(numpy.abs(self.application), 100), (90, 91, 92))
+            working = ~self.failed
+            for row in numpy.flatnonzero(slave):
+                findings[row].append("This device is in slave mode")
+            for row in numpy.flatnonzero(self.failed):
+                findings[row].append("NOT COMMUNICATING - {} controller may be broken".format(self._devices[row]))
+
+            sensor_hits = self.sensor_failed & working[self.sensor_rows]
+            for index in numpy.flatnonzero(sensor_hits):
+                findings[self.sensor_rows[index]].append("The {} sensor is Failed".format(self._sensor_names[index]))
+
+            dampers_working = working[self.damper_rows]
+            closed_leak = dampers_working & (self.damper_positions == 0) & (self.damper_airflows > 10)
+            fully_open = dampers_working & (self.damper_positions > 85)
+            for index in numpy.flatnonzero(closed_leak | fully_open):
+                row = self.damper_rows[index]
+                position = float(self.damper_positions[index])
+                airflow = float(self.damper_airflows[index])
+                if closed_leak[index]:
+                    findings[row].append("Slipped Damper - Airflow greater than 10 cfm across closed damper")
+                elif airflow < 150:
+                    findings[row].append("Slipped Damper - Airflow less than than 150 cfm across fully open damper")
+                else:
+                    findings[row].append("Potential Starved Zone - Damper {}% open with {} cfm of airflow".format(position, airflow))
+
+            temp_delta = self.column("CTL STPT") - self.column("CTL TEMP")
+            for row in numpy.flatnonzero(working & (numpy.abs(temp_delta) >= temp_differential)):
+                findings[row].append("Temperature Control Failure, CTL TEMP is currently {} degrees from CTL STPT".format(float(temp_delta[row])))
+
+            flow_delta = self.column("FLOW STPT") - self.column("FLOW")
+            for row in numpy.flatnonzero(working & (numpy.abs(flow_delta) > flow_differential)):
+                findings[row].append("Flow Control Failure, Flow is currently {} % from Flow Setpoint".format(float(flow_delta[row])))
+
+            for index in numpy.flatnonzero(self.auto_manual & working[self.auto_rows]):
+                findings[self.auto_rows[index]].append("{} Not in Automatic - Automatic operation of this point is essential for proper operation".format(self._auto_names[index]))
+            occ_flow = self.column("OCC FLOW")
+            unocc_flow = self.column("UNOCC FLOW")
+            both = working & ~numpy.isnan(occ_flow) & ~numpy.isnan(unocc_flow)
+            for row in numpy.flatnonzero(both & (occ_flow == 0)):
+                findings[row].append("Occ flow setpoint - The occupied mode has an airflow setpoint of zero")
+            for row in numpy.flatnonzero(both & (unocc_flow > occ_flow)):
+                findings[row].append("Unocc flow setpoint - The unoccupied mode has a higher airflow setpoint than occupied")
+        return zip(self.names, findings)
+
+
 class Point(object):
+    """A single BACnet/Apogee point.  The seven fields every report fills in live in __slots__; the Point Data Sorter
+    configuration fields (alarm limits, setpoint names and values, special modes...) live in a PointConfig that is only
+    allocated the first time one of them is assigned, and read back as '' until then.  The parsers intern the
+    low-cardinality fields (subpoint names, units, status, priority...), so every point shares one copy of each value
+    and comparisons against the interned Point.failed and Point.normal match on identity."""
 
-    failed = "*F*"
-    normal = "-N-"
+    failed = intern("*F*")
+    normal = intern("-N-")
+
+    __slots__ = ('device', 'address', 'name', 'value', 'units', 'status', 'priority', 'descriptor', '_config')
 
     def __init__(self):
         self.device = ''
@@ -242,67 +1123,38 @@ class Point(object):
         self.status = ''
         self.priority = ''
         self.descriptor = ''
-        self.system_name = ''
-        self.wire_resistance = ''
-        self.totalization = ''
-        self.standard_alarms = ''
-        self.special_mode_5 = ''
-        self.special_mode_4= ''
-        self.special_mode_3 = ''
-        self.special_mode_2 = ''
-        self.slope = ''
-        self.setpoint_value_5 = ''
-        self.setpoint_value_4 = ''
-        self.setpoint_value_3 = ''
-        self.setpoint_value_2 = ''
-        self.setpoint_value_1 = ''
-        self.setpoint_value_0 = ''
-        self.setpoint_name_5 = ''
-        self.setpoint_name_4 = ''
-        self.setpoint_name_3 = ''
-        self.setpoint_name_2 = ''
-        self.setpoint_name_1 = ''
-        self.setpoint_name_0 = ''
-        self.sensor_type = ''
-        self.reno = ''
-        self.priority = ''
-        self.popup = ''
-        self.point_type = ''
-        self.point_memo = ''
-        self.point_address = ''
-        self.panel_name = ''
-        self.out_of_service = ''
-        self.normal_ack_enabled = ''
-        self.night_mode_0 = ''
-        self.mode_delay = ''
-        self.low_alarm_limit = ''
-        self.level_delay = ''
-        self.intercept = ''
-        self.initial_value = ''
-        self.initial_priority = ''
-        self.informational_text = ''
-        self.high_alarm_limit = ''
-        self.graphic_name = ''
-        self.enhanced_alarms = ''
-        self.enhanced_alarm_mode_point = ''
-        self.engineering_units = ''
-        self.differential = ''
-        self.descriptor = ''
-        self.day_mode_1 = ''
-        self.cov_limit = ''
-        self.classification = ''
-        self.analog_representation = ''
-        self.alarmable = ''
-        self.alarm_message = ''
-        self.alarm_destinations = ''
-        self.aim = ''
-        self.address_type = ''
-        self.actuator_type = ''
-        self.number_of_decimal_places = ''
+        self._config = None
 
     def __repr__(self):
         return str([self.address, self.device, self.name, self.value, self.units, self.status, self.priority])
 
+    def to_record(self):
+        """flattens the point into builtins for ParseCache; the config fields are a tuple, or None if never set"""
+        config = None
+        if self._config is not None:
+            config = tuple([getattr(self._config, field) for field in PointConfig.__slots__])
+        return (_intern(self.device), self.address, _intern(self.name), self.value, _intern(self.units),
+                _intern(self.status), _intern(self.priority), _intern(self.descriptor), config)
+
+    @classmethod
+    def from_record(cls, record):
+        point = cls.__new__(cls)
+        point.__setstate__(record)
+        return point
+
+    def __getstate__(self):
+        """pickles as the to_record tuple, since protocols 0 and 1 can't pickle __slots__ classes on their own"""
+        return self.to_record()
+
+    def __setstate__(self, state):
+        (self.device, self.address, self.name, self.value, self.units, self.status, self.priority,
+         self.descriptor, config) = state
+        self._config = None
+        if config is not None:
+            self._config = PointConfig.__new__(PointConfig)
+            for field, value in zip(PointConfig.__slots__, config):
+                setattr(self._config, field, value)
+
     def is_out_of_auto(self):
         if self.priority !="NONE" and self.priority != "OVRD" and not(self.name.endswith("STPT")):
             return True
@@ -316,6 +1168,42 @@ class Point(object):
             return False
 
 
+class PointConfig(object):
+    """Side record holding the rarely used Point Data Sorter configuration fields of a Point"""
+
+    __slots__ = ('system_name', 'wire_resistance', 'totalization', 'standard_alarms', 'special_mode_5',
+                 'special_mode_4', 'special_mode_3', 'special_mode_2', 'slope', 'setpoint_value_5', 'setpoint_value_4',
+                 'setpoint_value_3', 'setpoint_value_2', 'setpoint_value_1', 'setpoint_value_0', 'setpoint_name_5',
+                 'setpoint_name_4', 'setpoint_name_3', 'setpoint_name_2', 'setpoint_name_1', 'setpoint_name_0',
+                 'sensor_type', 'reno', 'popup', 'point_type', 'point_memo', 'point_address', 'panel_name',
+                 'out_of_service', 'normal_ack_enabled', 'night_mode_0', 'mode_delay', 'low_alarm_limit', 'level_delay',
+                 'intercept', 'initial_value', 'initial_priority', 'informational_text', 'high_alarm_limit',
+                 'graphic_name', 'enhanced_alarms', 'enhanced_alarm_mode_point', 'engineering_units', 'differential',
+                 'day_mode_1', 'cov_limit', 'classification', 'analog_representation', 'alarmable', 'alarm_message',
+                 'alarm_destinations', 'aim', 'address_type', 'actuator_type', 'number_of_decimal_places')
+
+    def __init__(self):
+        for field in self.__slots__:
+            setattr(self, field, '')
+
+
+def _config_property(field):
+    """builds the Point attribute that forwards field to the Point's PointConfig, allocating it on first assignment"""
+    def getter(self):
+        if self._config is None:
+            return ''
+        return getattr(self._config, field)
+
+    def setter(self, value):
+        if self._config is None:
+            self._config = PointConfig()
+        setattr(self._config, field, value)
+    return property(getter, setter)
+
+for _field in PointConfig.__slots__:
+    setattr(Point, _field, _config_property(_field))
+
+
 class InvalidFilePath(Exception):
     def __init__(self, message):
         self.message = message
@@ -325,49 +1213,173 @@ class InvalidFilePath(Exception):
 
 
 class PanelPPCLReport(Report):
-    def __init__(self, report_path=None):
-        super(PanelPPCLReport, self).__init__(report_path)
-        if self.report_file_extension.endswith(".csv"):
-            raise InvalidFilePath("This application only accepts Panel PPCL Reports in .txt format")
-        else:
+
+    # a "Program Name:" header, a 12-13 space indented continuation of the previous line, or a numbered PPCL line
+    line_pattern = re.compile(r"^(?:Program Name:(.+)|\s{12,13}(\S.*)|[EUTD]{1,2}\s{3,6}([0-9]{1,5})\s+([^-]\S.*))")
+
+    def __init__(self, report_path=None, output_dir='', lines=None, analyze=True):
+        """analyze=False only opens the dump, leaving convert to be called"""
+        self.output_dir = output_dir
+        self.programs = []
+        self._written = set()
+        self.stats = {}
+        self.xref = PPCLIndex()
+        super(PanelPPCLReport, self).__init__(report_path, lines=lines)
+        if analyze:
             self.convert()
 
+    @_timed_stage('convert', lambda self: len(self.programs))
     def convert(self, file_as_list=None):
-        prog_check_regex = '^Program Name:(.+)'
+        """Splits the panel dump into one <program name>.pcl file per program.  Each line is classified by a single
+        precompiled pattern as it streams past, and a program's lines are written out, sorted by line number, as soon as
+        the next "Program Name:" line or the end of the dump closes it.  A program name that appears in two separate
+        blocks of the dump has its blocks merged, the later block's lines replacing same-numbered earlier ones.  Each
+        written program's reassembled lines, continuations included, are indexed into self.xref.  Throughput is recorded
+        in self.stats.  The dump is read straight from its memory map, so memory stays flat however large it is, and is
+        closed when the conversion finishes"""
         if file_as_list is not None:
             self.data = file_as_list
-        pcl_files = {}
-        for line in self.data:
-            prog_check = re.split(prog_check_regex, line)
-            if len(prog_check) > 1:
-                program_name = prog_check[1].strip()
-            fractline = re.split('^\s{12,13}(\S.*)', line)
-            if len(fractline) > 1:
-                pcl_files[program_name][linenumber] = "".join([pcl_files[program_name][linenumber], fractline[1]])
-            newline = re.split("^[EUTD]{1,2}\s{3,6}([0-9]{1,5})\s+([^-]\S.*)", line)
-            if len(newline) > 1:
-                linenumber = int(newline[1])
-                code = newline[2]
-                try:
-                    pcl_files[program_name][linenumber] = code
-                except KeyError:
-                    pcl_files[program_name] = {linenumber: code}
-        for key, value in pcl_files.items():
-            buffer_list = []
-            for linenumber in sorted(value.keys()):
-                buffer_list.append("\t".join([str(linenumber), value[linenumber]+"\n"]))
-            newfile = open(key+".pcl", mode='w+')
-            newfile.writelines(buffer_list)
+        start = time.time()
+        line_count = 0
+        program_name = None
+        program = {}
+        linenumber = None
+        classify = self.line_pattern.match
+        try:
+            for line in self.data:
+                line_count += 1
+                # the map hands out lines as stored, so drop the \r of the front end's CRLF line endings too
+                match = classify(line.rstrip("\r\n"))
+                if match is None:
+                    continue
+                name, fractline, number, code = match.groups()
+                if name is not None:
+                    self._write_program(program_name, program)
+                    program_name = name.strip()
+                    program = {}
+                    linenumber = None
+                elif number is not None:
+                    linenumber = int(number)
+                    program[linenumber] = code
+                elif linenumber is not None:
+                    program[linenumber] += fractline
+            self._write_program(program_name, program)
+        finally:
+            self.close()
+        elapsed = max(time.time() - start, 1e-9)
+        self.stats = {'lines': line_count, 'programs': len(self.programs), 'seconds': elapsed,
+                      'lines_per_sec': line_count / elapsed, 'programs_per_sec': len(self.programs) / elapsed}
+        return self.stats
+
+    def _write_program(self, program_name, program):
+        if program_name is None or not program:
+            return
+        path = os.path.join(self.output_dir, program_name+".pcl")
+        if program_name in self._written:
+            merged = self._read_program(path)
+            merged.update(program)
+            program = merged
+        with open(path, 'w', 1 << 16) as newfile:
+            for linenumber in sorted(program):
+                newfile.write("\t".join([str(linenumber), program[linenumber]+"\n"]))
+        if program_name not in self._written:
+            self._written.add(program_name)
+            self.programs.append(program_name)
+        self.xref.add_program(program_name, program)
+
+    @staticmethod
+    def _read_program(path):
+        """reads a program back from the .pcl file _write_program wrote, for merging a later block of it"""
+        program = {}
+        with open(path, 'r') as pclfile:
+            for line in pclfile:
+                linenumber, code = line.rstrip("\n").split("\t", 1)
+                program[int(linenumber)] = code
+        return program
+
+
+class PPCLIndex(object):
+    """Cross-reference of the points PPCL programs refer to: point name -> [(program, line number, statement kind)].
+    References are the quoted point names in each line.  A reference's kind is the command it is an argument of
+    (ON, SET, IF, ...), ASSIGN when the line assigns to it, or REF when neither applies.  Re-adding a program replaces
+    its references.  save and load persist the index as JSON"""
+
+    # a quoted point name, or the PPCL command opening a parenthesised argument list
+    token_pattern = re.compile(r'"([^"]+)"|\b([A-Z][A-Z0-9]*)\s*\(')
+    assignment_pattern = re.compile(r"\s*=")
+
+    def __init__(self):
+        self.references = {}
+        self._program_points = {}
+
+    def add_program(self, program_name, program):
+        """indexes program, a {line number: reassembled line} dict"""
+        self.remove_program(program_name)
+        points = self._program_points[program_name] = set()
+        for linenumber in sorted(program):
+            line = program[linenumber]
+            kind = "REF"
+            for match in self.token_pattern.finditer(line):
+                name, command = match.groups()
+                if command is not None:
+                    kind = command
+                    continue
+                if self.assignment_pattern.match(line, match.end()):
+                    reference_kind = "ASSIGN"
+                else:
+                    reference_kind = kind
+                self.references.setdefault(name, []).append((program_name, linenumber, reference_kind))
+                points.add(name)
+
+    def remove_program(self, program_name):
+        for name in self._program_points.pop(program_name, ()):
+            remaining = [reference for reference in self.references[name] if reference[0] != program_name]
+            if remaining:
+                self.references[name] = remaining
+            else:
+                del self.references[name]
+
+    def lookup(self, point_name):
+        """[(program, line number, statement kind)] for every line that refers to point_name"""
+        return self.references.get(point_name, [])
+
+    def join(self, point_log, category='Not in Auto'):
+        """[(point name, program, line number, statement kind)] for every program line that refers to a point a
+        PanelPointLogReport put in category; points no program refers to are left out"""
+        rows = []
+        for name in point_log.analysis.get(category, []):
+            for program_name, linenumber, kind in self.lookup(name):
+                rows.append((name, program_name, linenumber, kind))
+        return rows
+
+    def save(self, path):
+        _save_json(path, self.references)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with open(path, 'rb') as index_file:
+            stored = _json_load(index_file)
+        for name, references in stored.items():
+            index.references[name] = [tuple(reference) for reference in references]
+            for program_name, _, _ in index.references[name]:
+                index._program_points.setdefault(program_name, set()).add(name)
+        return index
 
 
 class PanelPointLogReport(Report):
-    def __init__(self, report_path=None):
-        super(PanelPointLogReport, self).__init__(report_path)
+    def __init__(self, report_path=None, lines=None, analyze=True):
+        super(PanelPointLogReport, self).__init__(report_path, lines=lines)
         self.point_list = []
         self.analysis = {}
         self.build_points()
-        self._analyze()
+        if analyze:
+            self._analyze()
 
+    def iter_points(self):
+        return iter(self.point_list)
+
+    @_timed_stage('build_points', lambda self: len(self.point_list))
     def build_points(self):
         for line in self.data:
             if len(line[0]) < 100:
@@ -388,22 +1400,23 @@ class PanelPointLogReport(Report):
         point.address = line[2]
         point.descriptor = line[3]
         point.value = line[4]
-        point.units = line[5]
-        point.status, point.priority = line[6].split("  ", 1)
-        point.status = point.status.strip()
-        point.priority = point.priority.strip()
+        point.units = intern(line[5])
+        status, priority = line[6].split("  ", 1)
+        point.status = intern(status.strip())
+        point.priority = intern(priority.strip())
         return point
 
     def _map_abberation(self, line, point):
         point.address = line[1]
         point.descriptor = line[2]
         point.value = line[3]
-        point.units = line[4]
-        point.status, point.priority = line[5].split("  ", 1)
-        point.status = point.status.strip()
-        point.priority = point.priority.strip()
+        point.units = intern(line[4])
+        status, priority = line[5].split("  ", 1)
+        point.status = intern(status.strip())
+        point.priority = intern(priority.strip())
         return point
 
+    @_timed_stage('analyze', lambda self: len(self.point_list))
     def _analyze(self):
         for point in self.point_list:
             if point.priority !="NONE" and point.priority != "OVRD" and not(point.name.endswith("STPT")):
@@ -421,16 +1434,70 @@ class PanelPointLogReport(Report):
                     self.analysis['Not in Normal'] = []
                     self.analysis['Not in Normal'].append(point.name)
 
+    def dump_analysis(self, outfile=None):
+        if outfile is None:
+            outfile = _file_dialog().asksaveasfile()
+        writer = csv.writer(outfile, lineterminator='\n')
+        for category, names in self.analysis.items():
+            for name in names:
+                writer.writerow([category, name])
+
 
 class PointDataSorter(Report):
-    def __init__(self, report_path=None):
+
+    # (Point field, Point Data Sorter column header) for every column the report can carry
+    columns = (('device', 'Panel Name'), ('address', 'Point Address'), ('name', 'Name'), ('system_name', 'System Name'),
+               ('wire_resistance', 'Wire Resistance'), ('totalization', 'Totalization'),
+               ('standard_alarms', 'Standard Alarms'), ('special_mode_5', 'Special Mode (5)'),
+               ('special_mode_4', 'Special Mode (4)'), ('special_mode_3', 'Special Mode (3)'),
+               ('special_mode_2', 'Special Mode (2)'), ('slope', 'Slope'), ('setpoint_value_5', 'Setpoint Value(5)'),
+               ('setpoint_value_4', 'Setpoint Value(4)'), ('setpoint_value_3', 'Setpoint Value(3)'),
+               ('setpoint_value_2', 'Setpoint Value(2)'), ('setpoint_value_1', 'Setpoint Value(1)'),
+               ('setpoint_value_0', 'Setpoint Value(0)'), ('setpoint_name_5', 'Setpoint Name(5)'),
+               ('setpoint_name_4', 'Setpoint Name(4)'), ('setpoint_name_3', 'Setpoint Name(3)'),
+               ('setpoint_name_2', 'Setpoint Name(2)'), ('setpoint_name_1', 'Setpoint Name(1)'),
+               ('setpoint_name_0', 'Setpoint Name(0)'), ('sensor_type', 'Sensor Type'), ('reno', 'RENO'),
+               ('priority', 'Priority'), ('popup', 'Popup'), ('point_type', 'Point Type'), ('point_memo', 'Point Memo'),
+               ('panel_name', 'Panel Name'), ('out_of_service', 'Out of Service'),
+               ('normal_ack_enabled', 'Normal ack Enabled'), ('night_mode_0', 'Night Mode (0)'),
+               ('mode_delay', 'Mode Delay'), ('low_alarm_limit', 'Low Alarm Limit'), ('level_delay', 'Level Delay'),
+               ('intercept', 'Intercept'), ('initial_value', 'Initial Value'), ('initial_priority', 'Initial Priority'),
+               ('informational_text', 'Informational Text'), ('high_alarm_limit', 'High Alarm Limit'),
+               ('graphic_name', 'Graphic Name'), ('enhanced_alarms', 'Enhanced Alarms'),
+               ('enhanced_alarm_mode_point', 'Enhanced Alarm Mode Point'), ('engineering_units', 'Engineering Units'),
+               ('differential', 'Differential'), ('descriptor', 'Descriptor'), ('day_mode_1', 'Day Mode (1)'),
+               ('cov_limit', 'COV Limit'), ('classification', 'Classification'),
+               ('analog_representation', 'Analog Representation'), ('alarmable', 'Alarmable'),
+               ('alarm_message', 'Alarm Message'), ('alarm_destinations', 'Alarm Destinations'), ('aim', 'AIM'),
+               ('address_type', 'Address Type'), ('actuator_type', 'Actuator Type'),
+               ('number_of_decimal_places', '# of decimal places'))
+    # fields with a handful of distinct values across a site, interned as they are loaded
+    symbol_fields = frozenset(('device', 'panel_name', 'priority', 'point_type', 'engineering_units', 'sensor_type',
+                               'actuator_type', 'address_type', 'analog_representation', 'classification', 'alarmable',
+                               'out_of_service', 'normal_ack_enabled', 'enhanced_alarms', 'totalization',
+                               'standard_alarms', 'number_of_decimal_places', 'initial_priority', 'reno', 'popup',
+                               'alarm_destinations', 'slope', 'intercept', 'cov_limit', 'differential'))
+    # the fields analyze() looks at, for loading with columns=PointDataSorter.analysis_fields
+    analysis_fields = ('device', 'address', 'name', 'system_name')
+
+    def __init__(self, report_path=None, cache=None, columns=None, lines=None, analyze=True):
+        """columns optionally limits loading to those Point fields; the rest are left as ''"""
         self.data = []
-        super(PointDataSorter, self).__init__(report_path)
+        self.fields = columns
+        self.missing_columns = []
+        self._width = 0
+        self._core_columns = []
+        self._config_columns = []
+        self._symbol_columns = []
+        super(PointDataSorter, self).__init__(report_path, cache, lines)
         self.point_list = []
         self.analysis = {}
         self.build_points()
-        self.analyze()
-        print self.analysis
+        if analyze:
+            self.analyze()
+
+    def iter_points(self):
+        return iter(self.point_list)
 
     def load_csv(self, filepath=None):
         if filepath is not None:
@@ -438,91 +1505,1231 @@ class PointDataSorter(Report):
                 self.report_path = filepath
             else:
                 return InvalidFilePath
-        infile = open(self.report_path,'rb')
-        infile.seek(0)
-        next(infile)
-        reader = csv.DictReader(infile)
+        lines = self._open_lines()
+        next(lines, None)
+        reader = csv.reader(lines)
+        self._project(next(reader, []))
+        self.data = self._without_trailer(reader)
+
+    def _cache_kind(self):
+        if self.fields is None:
+            return type(self).__name__
+        return "{}[{}]".format(type(self).__name__, ",".join(sorted(self.fields)))
+
+    def _project(self, header):
+        """resolves the header row to (field, column index) pairs once, split into the slotted Point fields and the
+        PointConfig ones, notes which columns hold symbol_fields, and reports the columns this export is missing"""
+        positions = dict((name, index) for index, name in enumerate(header))
+        self._width = len(header)
+        self.missing_columns = []
+        for field, name in self.columns:
+            if self.fields is not None and field not in self.fields:
+                continue
+            if name not in positions:
+                if name not in self.missing_columns:
+                    self.missing_columns.append(name)
+                continue
+            if field in self.symbol_fields and positions[name] not in self._symbol_columns:
+                self._symbol_columns.append(positions[name])
+            if field in Point.__slots__:
+                self._core_columns.append((field, positions[name]))
+            else:
+                self._config_columns.append((field, positions[name]))
+        if self.missing_columns:
+            print >> sys.stderr, self.report_path, "is missing columns:", ", ".join(self.missing_columns)
+
+    @staticmethod
+    def _without_trailer(reader):
+        """yields every row but the last, which is the report's trailer"""
+        previous = None
         for row in reader:
-            self.data.append(row)
-        self.data = self.data[:-1]
+            if previous is not None:
+                yield previous
+            previous = row
 
+    @_timed_stage('build_points', lambda self: len(self.point_list))
     def build_points(self):
-        for row in self.data:
-            point = Point()
-            point.device = self._keyerr_as_emptystring(row, 'Panel Name')
-            point.address = self._keyerr_as_emptystring(row, 'Point Address')
-            point.name = self._keyerr_as_emptystring(row, 'Name') #used for system name on all but PDS points
-            point.system_name = self._keyerr_as_emptystring(row, 'System Name')
-            point.wire_resistance = self._keyerr_as_emptystring(row, 'Wire Resistance')
-            point.totalization = self._keyerr_as_emptystring(row, 'Totalization')
-            point.standard_alarms = self._keyerr_as_emptystring(row, 'Standard Alarms')
-            point.special_mode_5 = self._keyerr_as_emptystring(row, 'Special Mode (5)')
-            point.special_mode_4 = self._keyerr_as_emptystring(row, 'Special Mode (4)')
-            point.special_mode_3 = self._keyerr_as_emptystring(row, 'Special Mode (3)')
-            point.special_mode_2 = self._keyerr_as_emptystring(row, 'Special Mode (2)')
-            point.slope = self._keyerr_as_emptystring(row, 'Slope')
-            point.setpoint_value_5 = self._keyerr_as_emptystring(row, 'Setpoint Value(5)')
-            point.setpoint_value_4 = self._keyerr_as_emptystring(row, 'Setpoint Value(4)')
-            point.setpoint_value_3 = self._keyerr_as_emptystring(row, 'Setpoint Value(3)')
-            point.setpoint_value_2 = self._keyerr_as_emptystring(row, 'Setpoint Value(2)')
-            point.setpoint_value_1 = self._keyerr_as_emptystring(row, 'Setpoint Value(1)')
-            point.setpoint_value_0 = self._keyerr_as_emptystring(row, 'Setpoint Value(0)')
-            point.setpoint_name_5 = self._keyerr_as_emptystring(row, 'Setpoint Name(5)')
-            point.setpoint_name_4 = self._keyerr_as_emptystring(row, 'Setpoint Name(4)')
-            point.setpoint_name_3 = self._keyerr_as_emptystring(row, 'Setpoint Name(3)')
-            point.setpoint_name_2 = self._keyerr_as_emptystring(row, 'Setpoint Name(2)')
-            point.setpoint_name_1 = self._keyerr_as_emptystring(row, 'Setpoint Name(1)')
-            point.setpoint_name_0 = self._keyerr_as_emptystring(row, 'Setpoint Name(0)')
-            point.sensor_type = self._keyerr_as_emptystring(row, 'Sensor Type')
-            point.reno = self._keyerr_as_emptystring(row, 'RENO')
-            point.priority = self._keyerr_as_emptystring(row, 'Priority')
-            point.popup = self._keyerr_as_emptystring(row, 'Popup')
-            point.point_type = self._keyerr_as_emptystring(row, 'Point Type')
-            point.point_memo = self._keyerr_as_emptystring(row, 'Point Memo')
-            point.panel_name = self._keyerr_as_emptystring(row, 'Panel Name')
-            point.out_of_service =  self._keyerr_as_emptystring(row, 'Out of Service')
-            point.normal_ack_enabled =  self._keyerr_as_emptystring(row, 'Normal ack Enabled')
-            point.night_mode_0 =  self._keyerr_as_emptystring(row, 'Night Mode (0)')
-            point.mode_delay =  self._keyerr_as_emptystring(row, 'Mode Delay')
-            point.low_alarm_limit =  self._keyerr_as_emptystring(row, 'Low Alarm Limit')
-            point.level_delay =  self._keyerr_as_emptystring(row, 'Level Delay')
-            point.intercept =  self._keyerr_as_emptystring(row, 'Intercept')
-            point.initial_value =  self._keyerr_as_emptystring(row, 'Initial Value')
-            point.initial_priority =  self._keyerr_as_emptystring(row, 'Initial Priority')
-            point.informational_text =  self._keyerr_as_emptystring(row, 'Informational Text')
-            point.high_alarm_limit =  self._keyerr_as_emptystring(row, 'High Alarm Limit')
-            point.graphic_name =  self._keyerr_as_emptystring(row, 'Graphic Name')
-            point.enhanced_alarms =  self._keyerr_as_emptystring(row, 'Enhanced Alarms')
-            point.enhanced_alarm_mode_point =  self._keyerr_as_emptystring(row, 'Enhanced Alarm Mode Point')
-            point.engineering_units =  self._keyerr_as_emptystring(row, 'Engineering Units')
-            point.differential =  self._keyerr_as_emptystring(row, 'Differential')
-            point.descriptor = self._keyerr_as_emptystring(row, 'Descriptor')
-            point.day_mode_1 = self._keyerr_as_emptystring(row, 'Day Mode (1)')
-            point.cov_limit = self._keyerr_as_emptystring(row, 'COV Limit')
-            point.classification =  self._keyerr_as_emptystring(row, 'Classification')
-            point.analog_representation =  self._keyerr_as_emptystring(row, 'Analog Representation')
-            point.alarmable = self._keyerr_as_emptystring(row, 'Alarmable')
-            point.alarm_message = self._keyerr_as_emptystring(row, 'Alarm Message')
-            point.alarm_destinations = self._keyerr_as_emptystring(row, 'Alarm Destinations')
-            point.aim = self._keyerr_as_emptystring(row, 'AIM')
-            point.address_type = self._keyerr_as_emptystring(row, 'Address Type')
-            point.actuator_type = self._keyerr_as_emptystring(row, 'Actuator Type')
-            point.number_of_decimal_places = self._keyerr_as_emptystring(row, '# of decimal places')
+        if self._cached is not None:
+            self.point_list = [Point.from_record(record) for record in self._cached]
+            return
+        writer = None
+        if self.cache is not None:
+            writer = self.cache.writer(self._cache_key)
+        try:
+            for row in self.data:
+                point = self._build_point(row)
+                self.point_list.append(point)
+                if writer is not None:
+                    writer.write(point.to_record())
+            if writer is not None:
+                writer.commit()
+        finally:
+            if writer is not None:
+                writer.discard()
+
+    def _build_point(self, row):
+        if len(row) < self._width:
+            row = row + [''] * (self._width - len(row))
+        for index in self._symbol_columns:
+            row[index] = intern(row[index])
+        point = Point()
+        for field, index in self._core_columns:
+            setattr(point, field, row[index])
+        if self._config_columns:
+            config = point._config = PointConfig()
+            for field, index in self._config_columns:
+                setattr(config, field, row[index])
+        return point
 
+    @_timed_stage('analyze', lambda self: len(self.point_list))
     def analyze(self):
         for point in self.point_list:
-            print point.name, point.system_name
             if point.name != point.system_name:
                 try:
                     self.analysis["Name Mismatch"].append(point)
                 except KeyError:
                     self.analysis["Name Mismatch"] = [point]
 
-    def _keyerr_as_emptystring(self, dictionary, key):
+    def dump_analysis(self, outfile=None):
+        if outfile is None:
+            outfile = _file_dialog().asksaveasfile()
+        writer = csv.writer(outfile, lineterminator='\n')
+        for category, points in self.analysis.items():
+            for point in points:
+                writer.writerow([category, point.name, point.system_name])
+
+
+class ParseCache(object):
+    """On-disk cache of parsed reports, keyed by the SHA-1 of the report's contents, PARSER_VERSION, the report class and
+    the Python version.  An entry is a stream of marshalled TEC or Point records, written while the report is parsed and
+    read back without touching the CSV.  Entries beyond max_bytes are evicted least recently used first.  Pass
+    rebuild=True to ignore existing entries and re-parse (overwriting them); pass no cache at all to bypass it."""
+
+    suffix = ".cache"
+
+    def __init__(self, directory=None, max_bytes=1 << 30, rebuild=False):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser("~"), ".sodda_cache")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rebuild = rebuild
+
+    def key(self, report_path, kind):
+        digest = hashlib.sha1("{}:{}:{}.{}:".format(PARSER_VERSION, kind, *sys.version_info[:2]))
+        with open(report_path, 'rb') as report_file:
+            for chunk in iter(lambda: report_file.read(1 << 20), ''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def records(self, key):
+        """returns an iterator over the records cached under key, or None on a miss or when rebuilding"""
+        if self.rebuild:
+            return None
+        path = self.path(key)
         try:
-            return dictionary[key]
-        except KeyError:
-            print dictionary, key, "Not Found"
-            return ''
+            cache_file = open(path, 'rb')
+        except IOError:
+            return None
+        os.utime(path, None)
+        return self._read(cache_file)
+
+    @staticmethod
+    def _read(cache_file):
+        with cache_file:
+            while True:
+                try:
+                    yield marshal.load(cache_file)
+                except EOFError:
+                    return
+
+    def writer(self, key):
+        return CacheWriter(self, key)
+
+    def evict(self, keep=None):
+        """deletes the least recently used entries, other than the one at path keep, until the cache fits in max_bytes"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class CacheWriter(object):
+    """Writes one ParseCache entry to a temporary file, which only replaces the entry on commit()"""
+
+    def __init__(self, cache, key):
+        if not os.path.isdir(cache.directory):
+            try:
+                os.makedirs(cache.directory)
+            except OSError:
+                if not os.path.isdir(cache.directory):
+                    raise
+        self.cache = cache
+        self.path = cache.path(key)
+        self._temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        self._file = open(self._temp_path, 'wb')
+
+    def write(self, record):
+        marshal.dump(record, self._file)
+
+    def commit(self):
+        self._file.close()
+        _replace_file(self._temp_path, self.path)
+        self._file = None
+        self.cache.evict(keep=self.path)
+
+    def discard(self):
+        """drops an uncommitted entry; does nothing once commit() has run"""
+        if self._file is not None:
+            self._file.close()
+            os.remove(self._temp_path)
+            self._file = None
+
+
+class UnknownReportType(ValueError):
+    pass
+
+
+ReportType = collections.namedtuple('ReportType', 'name report_class sniff format')
+
+# report type name: ReportType, in the order detection tries them
+REPORT_REGISTRY = collections.OrderedDict()
+
+# how much of the start of a file report type detection looks at
+SNIFF_BYTES = 8192
+
+
+# how a report type's file is read: 'csv' rows, or plain 'lines'
+REPORT_FORMATS = ('csv', 'lines')
+
+
+def register_report_type(name, report_class, sniff, format='csv'):
+    """makes report_class available to detect_report_type, open_report and batch as name.  sniff(head) is given the
+    first SNIFF_BYTES of a file and returns whether it is this kind of report; types are tried in the order they were
+    registered, so a type whose sniff is a looser heuristic should be registered after the stricter ones.  format is
+    one of REPORT_FORMATS and decides how the report is read, whatever the file's extension"""
+    if format not in REPORT_FORMATS:
+        raise ValueError("Unknown report format {}".format(format))
+    REPORT_REGISTRY[name] = ReportType(name, report_class, sniff, format)
+
+
+def sniff_report_type(head):
+    """returns the name of the first registered report type whose sniff accepts head"""
+    for report_type in REPORT_REGISTRY.values():
+        if report_type.sniff(head):
+            return report_type.name
+    raise UnknownReportType("Not a recognised report: the first {} bytes match no registered report type"
+                            .format(len(head)))
+
+
+def detect_report_type(report_path):
+    with MappedLines(report_path) as lines:
+        return sniff_report_type(lines.head(SNIFF_BYTES))
+
+
+def open_report(report_path, report_type=None, lines=None, options=None, **kwargs):
+    """constructs the registered Report subclass for report_path, detecting its type first if report_type is None, and
+    returns it with the type's name in report.report_type.  The file is mapped once, or not at all if the caller hands
+    over its MappedLines: the lines sniffed for detection are given to the report, which owns them from then on and
+    closes them when it has read them.  kwargs go to the report's constructor, along with options[report type] when
+    options, a {report type: kwargs} dict, has an entry for the report's type"""
+    if lines is None:
+        lines = MappedLines(report_path)
+    try:
+        if report_type is None:
+            report_type = sniff_report_type(lines.head(SNIFF_BYTES))
+        if report_type not in REPORT_REGISTRY:
+            raise UnknownReportType("Unknown report type {}".format(report_type))
+        if options is not None and report_type in options:
+            kwargs = dict(kwargs, **options[report_type])
+        report = REPORT_REGISTRY[report_type].report_class(report_path, lines=lines, **kwargs)
+    except:
+        lines.close()
+        raise
+    report.report_type = report_type
+    return report
+
+
+def _sniff_subpoint(head):
+    return "TEC System Name:" in head
+
+
+def _sniff_ppcl(head):
+    return "Program Name:" in head
+
+
+def _sniff_point_data(head):
+    """the Point Data Sorter column header is the second line"""
+    lines = head.split("\n", 2)
+    return len(lines) > 2 and "Point Address" in lines[1] and "System Name" in lines[1]
+
+
+# the "status  priority" column of a Panel Point Log row
+_point_log_status = re.compile(r"^\S+ {2,}\S+$")
+
+
+def _sniff_point_log(head):
+    """any complete row, normal or aberration, whose last column is a Point Log status and priority"""
+    lines = head.splitlines()
+    if len(head) == SNIFF_BYTES and not head.endswith("\n"):
+        # the head cut the last line short
+        lines = lines[:-1]
+    for row in csv.reader(lines):
+        if len(row) in (6, 7) and _point_log_status.match(row[-1].strip()):
+            return True
+    return False
+
+
+register_report_type('subpoint', SubpointReport, _sniff_subpoint)
+register_report_type('ppcl', PanelPPCLReport, _sniff_ppcl, 'lines')
+register_report_type('pointdata', PointDataSorter, _sniff_point_data)
+register_report_type('pointlog', PanelPointLogReport, _sniff_point_log)
+
+
+IndexedPoint = collections.namedtuple('IndexedPoint', 'device address name value units status priority report report_type '
+                                                     'timestamp')
+
+
+class PointIndex(object):
+    """SQLite database of the points of every report added to it, for questions across buildings and reports such as
+    index.query(name="CTL STPT", not_priority="NONE") or index.devices(name="APPLICATION", status=Point.failed).
+    Each point is stored with its source report and that report's timestamp, the file's modification time.  Adding a
+    report again with the same path and timestamp replaces its points.  A report's points are inserted in batches of
+    batch_size inside a single transaction"""
+
+    fields = ('device', 'address', 'name', 'value', 'units', 'status', 'priority')
+    # the Point Data Sorter columns that fill those fields; its units are its Engineering Units, stored as units
+    point_data_fields = ('device', 'address', 'name', 'engineering_units', 'priority')
+
+    def __init__(self, path, batch_size=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path)
+        # report text is bytes in whatever code page the front end used, so store and return it unchanged
+        self.connection.text_factory = str
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS reports (id INTEGER PRIMARY KEY, path TEXT NOT NULL, type TEXT NOT NULL,
+                                                    timestamp REAL NOT NULL, loaded REAL NOT NULL,
+                                                    UNIQUE (path, timestamp));
+                CREATE TABLE IF NOT EXISTS points (report_id INTEGER NOT NULL REFERENCES reports (id), device TEXT,
+                                                   address TEXT, name TEXT, value TEXT, units TEXT, status TEXT,
+                                                   priority TEXT);
+                CREATE INDEX IF NOT EXISTS points_name_priority ON points (name, priority);
+                CREATE INDEX IF NOT EXISTS points_name_status ON points (name, status);
+                CREATE INDEX IF NOT EXISTS points_device ON points (device);
+                CREATE INDEX IF NOT EXISTS points_report ON points (report_id);
+            """)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_report(self, report_path, report_type=None, cache=None):
+        """parses report_path, detecting its type if report_type is None, and stores its points.  The report type must
+        offer iter_points() and accept analyze=False.  Returns the number of points stored"""
+        report = open_report(report_path, report_type, analyze=False,
+                             options={'subpoint': {'cache': cache},
+                                      'pointdata': {'cache': cache, 'columns': self.point_data_fields}})
+        try:
+            if not hasattr(report, 'iter_points'):
+                raise UnknownReportType("{} reports have no points to index".format(report.report_type))
+            return self._store(report_path, report.report_type, report.iter_points())
+        finally:
+            report.close()
+
+    def _store(self, report_path, report_type, points):
+        timestamp = os.path.getmtime(report_path)
+        count = 0
+        with self.connection:
+            cursor = self.connection.cursor()
+            for (report_id,) in cursor.execute("SELECT id FROM reports WHERE path = ? AND timestamp = ?",
+                                               (report_path, timestamp)).fetchall():
+                cursor.execute("DELETE FROM points WHERE report_id = ?", (report_id,))
+                cursor.execute("DELETE FROM reports WHERE id = ?", (report_id,))
+            cursor.execute("INSERT INTO reports (path, type, timestamp, loaded) VALUES (?, ?, ?, ?)",
+                           (report_path, report_type, timestamp, time.time()))
+            report_id = cursor.lastrowid
+            insert = "INSERT INTO points (report_id, {}) VALUES (?, {})".format(", ".join(self.fields),
+                                                                               ", ".join("?" * len(self.fields)))
+            units = 'engineering_units' if report_type == 'pointdata' else 'units'
+            batch = []
+            for point in points:
+                batch.append((report_id, point.device, point.address, point.name, point.value, getattr(point, units),
+                              point.status, point.priority))
+                if len(batch) >= self.batch_size:
+                    cursor.executemany(insert, batch)
+                    count += len(batch)
+                    batch = []
+            cursor.executemany(insert, batch)
+            count += len(batch)
+        return count
+
+    def _where(self, criteria, latest):
+        """builds the WHERE clause and parameters for query; not_<field> criteria exclude a value"""
+        clauses = []
+        parameters = []
+        for key, value in sorted(criteria.items()):
+            if value is None:
+                continue
+            negate = key.startswith("not_")
+            field = key[4:] if negate else key
+            if field == 'report_type':
+                column = "reports.type"
+            elif field in self.fields:
+                column = "points." + field
+            else:
+                raise TypeError("Unknown point criterion {}".format(key))
+            clauses.append("{} {} ?".format(column, "!=" if negate else "="))
+            parameters.append(value)
+        if latest:
+            clauses.append("reports.timestamp = (SELECT MAX(timestamp) FROM reports AS newer "
+                           "WHERE newer.path = reports.path)")
+        return " AND ".join(clauses) or "1", parameters
+
+    def query(self, latest=False, limit=None, **criteria):
+        """returns an IndexedPoint for every stored point matching all of criteria, which are point fields or
+        report_type, each optionally prefixed with not_ to exclude that value.  latest=True only looks at the most
+        recent snapshot of each report path"""
+        where, parameters = self._where(criteria, latest)
+        sql = ("SELECT points.device, points.address, points.name, points.value, points.units, points.status, "
+               "points.priority, reports.path, reports.type, reports.timestamp "
+               "FROM points JOIN reports ON reports.id = points.report_id WHERE " + where)
+        if limit is not None:
+            sql += " LIMIT {:d}".format(limit)
+        return [IndexedPoint(*row) for row in self.connection.execute(sql, parameters)]
+
+    def devices(self, latest=False, **criteria):
+        """returns the sorted distinct devices (TECs, for Subpoint reports) with a point matching criteria"""
+        where, parameters = self._where(criteria, latest)
+        sql = ("SELECT DISTINCT points.device FROM points JOIN reports ON reports.id = points.report_id WHERE " +
+               where + " ORDER BY points.device")
+        return [device for (device,) in self.connection.execute(sql, parameters)]
+
+    def count(self, latest=False, **criteria):
+        where, parameters = self._where(criteria, latest)
+        sql = "SELECT COUNT(*) FROM points JOIN reports ON reports.id = points.report_id WHERE " + where
+        return self.connection.execute(sql, parameters).fetchone()[0]
+
+
+class PointLogHistory(object):
+    """Append-only history of Panel Point Log snapshots in directory, for questions that span many of them.  Points
+    are numbered by a dictionary of point names, and statuses and priorities by dictionaries of their own, with code 0
+    meaning the point wasn't in that snapshot.  Each snapshot is appended to status.u8 and priority.u8 as one byte per
+    point known at the time, and history.json records the dictionaries and where each snapshot's row starts.  Queries
+    memory-map those files and evaluate every point over every snapshot at once with NumPy, so old logs are never
+    re-parsed.  Snapshots are ordered by their report's modification time"""
+
+    kinds = ('status', 'priority')
+
+    def __init__(self, directory):
+        if numpy is None:
+            raise ImportError("PointLogHistory requires numpy")
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._meta_path = os.path.join(directory, "history.json")
+        self.points = []
+        self.codes = {'status': [''], 'priority': ['']}
+        self.snapshots = []
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, 'rb') as meta_file:
+                meta = _json_load(meta_file)
+            self.points = meta['points']
+            for kind in self.kinds:
+                self.codes[kind] = meta['codes'][kind]
+            self.snapshots = meta['snapshots']
+        self._ids = dict((name, index) for index, name in enumerate(self.points))
+
+    def _data_path(self, kind):
+        return os.path.join(self.directory, kind + ".u8")
+
+    def add_report(self, report_path):
+        """parses a Panel Point Log report and appends it as a snapshot.  Returns the number of points in it"""
+        report = PanelPointLogReport(report_path, analyze=False)
+        return self.add_snapshot(report.point_list, report_path, os.path.getmtime(report_path))
+
+    def add_snapshot(self, points, report_path='', timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        lookups = dict((kind, dict((value, code) for code, value in enumerate(self.codes[kind])))
+                       for kind in self.kinds)
+        ids = []
+        values = {'status': [], 'priority': []}
+        for point in points:
+            point_id = self._ids.get(point.name)
+            if point_id is None:
+                point_id = self._ids[point.name] = len(self.points)
+                self.points.append(point.name)
+            ids.append(point_id)
+            for kind in self.kinds:
+                value = getattr(point, kind)
+                code = lookups[kind].get(value)
+                if code is None:
+                    if len(self.codes[kind]) > 255:
+                        raise ValueError("More than 255 distinct {} values in the history".format(kind))
+                    code = lookups[kind][value] = len(self.codes[kind])
+                    self.codes[kind].append(value)
+                values[kind].append(code)
+        offset = 0
+        if self.snapshots:
+            offset = self.snapshots[-1]['offset'] + self.snapshots[-1]['width']
+        width = len(self.points)
+        for kind in self.kinds:
+            row = numpy.zeros(width, numpy.uint8)
+            row[ids] = values[kind]
+            path = self._data_path(kind)
+            # a snapshot whose metadata never got written is overwritten, so the data files match history.json
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as data_file:
+                data_file.seek(offset)
+                data_file.truncate()
+                data_file.write(row.tostring())
+        self.snapshots.append({'report': report_path, 'timestamp': timestamp, 'offset': offset, 'width': width})
+        _save_json(self._meta_path, {'points': self.points, 'codes': self.codes, 'snapshots': self.snapshots})
+        return len(ids)
+
+    def matrix(self, kind, last=None):
+        """a (snapshot, point) array of kind codes, oldest snapshot first, limited to the last snapshots if given"""
+        snapshots = sorted(self.snapshots, key=lambda snapshot: snapshot['timestamp'])
+        if last is not None:
+            snapshots = snapshots[-last:] if last > 0 else []
+        codes = numpy.zeros((len(snapshots), len(self.points)), numpy.uint8)
+        if not snapshots or not self.points:
+            return codes
+        stored = numpy.memmap(self._data_path(kind), numpy.uint8, 'r')
+        for row, snapshot in enumerate(snapshots):
+            codes[row, :snapshot['width']] = stored[snapshot['offset']:snapshot['offset'] + snapshot['width']]
+        return codes
+
+    def _mask(self, kind, values, last=None, exclude=True):
+        """marks each (snapshot, point) whose kind is not among values (or is, if exclude is False); absent points are
+        never marked"""
+        codes = self.matrix(kind, last)
+        wanted = [code for code, value in enumerate(self.codes[kind]) if value in values]
+        mask = numpy.in1d(codes, wanted).reshape(codes.shape)
+        if exclude:
+            mask = ~mask & (codes != 0)
+        return mask
+
+    @staticmethod
+    def _runs(mask, current):
+        """per point, the run of marked snapshots ending at the latest one if current, else the longest run"""
+        if mask.shape[0] == 0:
+            # an empty history, or last=0, has no runs; argmin refuses an empty axis
+            return numpy.zeros(mask.shape[1], numpy.int64)
+        if current:
+            trailing = numpy.argmin(mask[::-1], axis=0)
+            return numpy.where(mask.all(axis=0), mask.shape[0], trailing)
+        run = numpy.zeros(mask.shape[1], numpy.int64)
+        longest = numpy.zeros(mask.shape[1], numpy.int64)
+        for row in mask:
+            run = (run + 1) * row
+            numpy.maximum(longest, run, longest)
+        return longest
+
+    def _ranked(self, counts, minimum):
+        selected = numpy.flatnonzero(counts >= minimum)
+        order = selected[numpy.argsort(-counts[selected], kind='mergesort')]
+        return [(self.points[point_id], int(counts[point_id])) for point_id in order]
+
+    def out_of_auto(self, min_snapshots, current=True, last=None):
+        """[(point name, snapshots)] for points out of automatic (priority other than NONE or OVRD, setpoints
+        excepted, as PanelPointLogReport judges it) for at least min_snapshots consecutive snapshots, ending at the
+        latest one if current, else anywhere in the history.  Longest first"""
+        mask = self._mask('priority', ("NONE", "OVRD"), last)
+        mask[:, [point_id for point_id, name in enumerate(self.points) if name.endswith("STPT")]] = False
+        return self._ranked(self._runs(mask, current), min_snapshots)
+
+    def out_of_normal(self, min_snapshots, current=True, last=None):
+        """like out_of_auto, for points whose status isn't normal"""
+        mask = self._mask('status', (Point.normal,), last)
+        return self._ranked(self._runs(mask, current), min_snapshots)
+
+    def flapping(self, min_changes, last=None):
+        """[(point name, changes)] for points whose status changed between consecutive snapshots they were both in at
+        least min_changes times, over the last snapshots if given.  Most changes first"""
+        codes = self.matrix('status', last)
+        present = (codes[1:] != 0) & (codes[:-1] != 0)
+        changes = ((codes[1:] != codes[:-1]) & present).sum(axis=0)
+        return self._ranked(changes, min_changes)
+
+
+class CorrelatedPoint(object):
+    """One point as every loaded report sees it: its Subpoint report subpoint, Panel Point Log point and Point Data
+    Sorter configuration, each None if that report doesn't have it.  joined_on is 'address' when the configuration was
+    matched by panel and address rather than by system name"""
+
+    __slots__ = ('name', 'subpoint', 'logged', 'configured', 'joined_on')
+
+    def __init__(self, name):
+        self.name = name
+        self.subpoint = None
+        self.logged = None
+        self.configured = None
+        self.joined_on = 'name'
+
+    def __repr__(self):
+        return str([self.name, self.subpoint, self.logged, self.configured])
+
+    @property
+    def observed(self):
+        """the point the current value comes from, the Point Log's if there is one"""
+        return self.logged if self.logged is not None else self.subpoint
+
+    @property
+    def descriptor(self):
+        for point in (self.configured, self.logged):
+            if point is not None and point.descriptor:
+                return point.descriptor
+        return ''
+
+
+class PointCorrelator(object):
+    """Joins the points of Subpoint reports, Panel Point Logs and Point Data Sorter reports into one CorrelatedPoint
+    per system name, then runs cross-report rules over them.  Each report added is hashed by system name, and Point
+    Logs added with their panel's name by (panel, address) too; correlate makes a single pass over the Point Data Sorter
+    points, looking each up by name and falling back to its panel and address, so nothing is ever scanned twice.
+    Subpoints are named the way the Subpoint report prints them, TEC:SUBPOINT"""
+
+    # the checks correlate runs on every joined point, in order
+    rules = ('outside_alarm_limits', 'name_mismatch', 'units_mismatch')
+    # the columns dump_analysis writes
+    fields = ('point', 'descriptor', 'rule', 'message')
+    # the Point Data Sorter fields the rules look at, for loading with columns=PointCorrelator.configuration_fields
+    configuration_fields = ('device', 'address', 'name', 'system_name', 'descriptor', 'alarmable', 'low_alarm_limit',
+                            'high_alarm_limit', 'engineering_units')
+
+    def __init__(self):
+        self.subpoints = {}
+        self.logged = {}
+        self.logged_addresses = {}
+        self.configured = []
+        self.points = collections.OrderedDict()
+        self.failures = []
+
+    def add_subpoints(self, report):
+        for point in report.iter_points():
+            self.subpoints["{}:{}".format(point.device, point.name)] = point
+
+    def add_point_log(self, report, panel=None):
+        """panel is the name of the field panel the log was taken from, without which its points can only be joined
+        by name"""
+        for point in report.iter_points():
+            self.logged[point.name] = point
+            if panel is not None:
+                self.logged_addresses[(panel, point.address)] = point.name
+
+    def add_point_data(self, report):
+        self.configured.extend(report.iter_points())
+
+    def add_report(self, report_path, report_type=None, panel=None):
+        """parses report_path, detecting its type if report_type is None, and adds its points.  panel is passed on for
+        Panel Point Logs"""
+        report = open_report(report_path, report_type, analyze=False,
+                             options={'pointdata': {'columns': self.configuration_fields}})
+        try:
+            if report.report_type == 'subpoint':
+                self.add_subpoints(report)
+            elif report.report_type == 'pointlog':
+                self.add_point_log(report, panel)
+            elif report.report_type == 'pointdata':
+                self.add_point_data(report)
+            else:
+                raise UnknownReportType("{} reports have no points to correlate".format(report.report_type))
+        finally:
+            report.close()
+
+    def _point(self, name):
+        point = self.points.get(name)
+        if point is None:
+            point = self.points[name] = CorrelatedPoint(name)
+        return point
+
+    @_timed_stage('correlate', lambda self: len(self.points))
+    def correlate(self):
+        """joins everything added so far into self.points, {system name: CorrelatedPoint}, and runs the rules over
+        them, leaving (point name, descriptor, rule, message) in self.failures.  Returns self.points"""
+        self.points = collections.OrderedDict()
+        self.failures = []
+        for name, point in self.subpoints.iteritems():
+            self._point(name).subpoint = point
+        for name, point in self.logged.iteritems():
+            self._point(name).logged = point
+        for point in self.configured:
+            name = point.system_name or point.name
+            if not name:
+                continue
+            if name not in self.points:
+                logged_name = self.logged_addresses.get((point.device, point.address))
+                if logged_name is not None:
+                    correlated = self.points[logged_name]
+                    if correlated.configured is None:
+                        correlated.configured = point
+                        correlated.joined_on = 'address'
+                        continue
+            self._point(name).configured = point
+        for correlated in self.points.itervalues():
+            for rule in self.rules:
+                message = getattr(self, rule)(correlated)
+                if message is not None:
+                    self.failures.append((correlated.name, correlated.descriptor, rule, message))
+                    if metrics.enabled:
+                        metrics.count("failures." + rule)
+        return self.points
+
+    @staticmethod
+    def _as_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    def outside_alarm_limits(self, correlated):
+        """only alarmable points are held to their alarm limits"""
+        observed = correlated.observed
+        if correlated.configured is None or observed is None:
+            return None
+        if correlated.configured.alarmable.strip().lower() != "yes":
+            return None
+        value = self._as_float(observed.value)
+        low = self._as_float(correlated.configured.low_alarm_limit)
+        high = self._as_float(correlated.configured.high_alarm_limit)
+        if value is None or low is None or high is None:
+            return None
+        if value < low or value > high:
+            return "Value {} is outside the configured alarm limits {} to {}".format(
+                observed.value, correlated.configured.low_alarm_limit, correlated.configured.high_alarm_limit)
+        return None
+
+    def name_mismatch(self, correlated):
+        if correlated.joined_on != 'address':
+            return None
+        configured = correlated.configured
+        return "Point Data Sorter names the point at {} {} {}".format(
+            configured.device, configured.address, configured.system_name or configured.name)
+
+    def units_mismatch(self, correlated):
+        observed = correlated.observed
+        if correlated.configured is None or observed is None:
+            return None
+        configured_units = correlated.configured.engineering_units
+        if configured_units and observed.units and configured_units != observed.units:
+            return "Reported in {} but configured in {}".format(observed.units, configured_units)
+        return None
+
+    def dump_analysis(self, outfile):
+        """writes self.failures through a FailureWriter, outfile being anything FailureWriter takes"""
+        with FailureWriter(outfile, fields=self.fields) as writer:
+            for failure in self.failures:
+                writer.write(*failure)
+
+
+def run_report(report_path, report_type, output_dir, cache=None, state_dir=None, failure_format='csv', compress=False,
+               chunk_workers=None):
+    """parses and analyzes a single report of the given type, or of the type detected from its contents if report_type
+    is 'auto', without opening any dialogs, writing its output under output_dir.  Registered types other than the
+    built-in ones are expected to offer point_list, analysis and dump_analysis(outfile) like the point reports.
+    Subpoint and Point Data reports are read through cache if one is given, except Subpoint reports split across
+    chunk_workers.  Subpoint findings are written by a FailureWriter in failure_format, gzipped if compress, and with
+    chunk_workers above one each Subpoint report is split across that many processes.  With a state_dir, Subpoint
+    reports are instead analyzed incrementally against the <report name>.json state kept there and their delta is
+    written.  Returns a summary dict; failures are recorded in it rather than raised, so one bad report doesn't stop a
+    batch"""
+    stem = os.path.splitext(os.path.basename(report_path))[0]
+    summary = {'report': report_path, 'type': report_type, 'status': 'ok', 'items': 0, 'findings': 0, 'output': '',
+               'seconds': 0.0, 'error': ''}
+    start = time.time()
+    lines = None
+    try:
+        if report_type == 'auto':
+            lines = MappedLines(report_path)
+            report_type = summary['type'] = sniff_report_type(lines.head(SNIFF_BYTES))
+        if report_type == 'subpoint' and state_dir is not None:
+            if chunk_workers is not None and chunk_workers > 1:
+                raise ValueError("Incremental analysis with a state_dir can't be split across chunk_workers")
+            if not os.path.isdir(state_dir):
+                os.makedirs(state_dir)
+            summary['output'] = os.path.join(output_dir, stem + "_delta.csv")
+            report = open_report(report_path, report_type, lines, outfile=summary['output'], cache=cache,
+                                 previous=os.path.join(state_dir, stem + ".json"))
+            summary['items'] = len(report.TECs)
+            summary['findings'] = len(report.delta['new']) + len(report.delta['unchanged'])
+        elif report_type == 'subpoint':
+            summary['output'] = os.path.join(output_dir, "{}_analysis.{}{}".format(stem, failure_format,
+                                                                                   ".gz" if compress else ""))
+            with FailureWriter(summary['output'], failure_format, compress) as writer:
+                report = open_report(report_path, report_type, lines, stream=True, outfile=writer, cache=cache,
+                                     workers=chunk_workers)
+            summary['items'] = len(report._headers)
+            summary['findings'] = report.failure_count
+        elif report_type == 'ppcl':
+            summary['output'] = os.path.join(output_dir, stem + "_pcl")
+            if not os.path.isdir(summary['output']):
+                os.makedirs(summary['output'])
+            report = open_report(report_path, report_type, lines, output_dir=summary['output'])
+            report.xref.save(os.path.join(summary['output'], "xref.json"))
+            summary['items'] = len(report.programs)
+        else:
+            report = open_report(report_path, report_type, lines,
+                                 options={'pointdata': {'cache': cache, 'columns': PointDataSorter.analysis_fields}})
+            summary['output'] = os.path.join(output_dir, stem + "_analysis.csv")
+            with open(summary['output'], 'wb') as outfile:
+                report.dump_analysis(outfile)
+            summary['items'] = len(report.point_list)
+            summary['findings'] = sum(len(found) for found in report.analysis.values())
+    except Exception as error:
+        summary['status'] = 'failed'
+        summary['error'] = "{}: {}".format(type(error).__name__, error)
+    finally:
+        if lines is not None:
+            lines.close()
+    summary['seconds'] = round(time.time() - start, 3)
+    return summary
+
+
+def _run_report_job(job):
+    """runs one batch job; when instrumented, returns its metrics snapshot alongside the summary so the parent process
+    can total them"""
+    global metrics
+    instrumented = job[-1]
+    if not instrumented:
+        return run_report(*job[:-1]), None
+    outer = metrics
+    metrics = Metrics()
+    metrics.enable()
+    try:
+        summary = run_report(*job[:-1])
+        return summary, metrics.snapshot()
+    finally:
+        metrics = outer
+
+
+def find_reports(patterns):
+    """expands each directory (its .csv and .txt files) or glob pattern into a sorted, de-duplicated list of paths"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in os.listdir(pattern)
+                       if os.path.splitext(name)[1].lower() in (".csv", ".txt")]
+        else:
+            matches = glob.glob(pattern)
+        for path in sorted(matches):
+            if os.path.isfile(path) and path not in paths:
+                paths.append(path)
+    return paths
+
+
+def run_batch(report_paths, report_type, output_dir, workers=None, cache=None, state_dir=None, failure_format='csv',
+              compress=False, instrumented=False, split=False):
+    """runs run_report over report_paths on a pool of worker processes (one per core by default) and writes a combined
+    summary.csv to output_dir.  With split, reports are instead run one at a time, each Subpoint report split across
+    the workers.  If instrumented, every report is run with metrics enabled and the workers' totals are
+    merged into sodda.metrics.  Returns the summaries in the same order as report_paths"""
+    if split and state_dir is not None:
+        raise ValueError("Reports analyzed incrementally with a state_dir can't be split")
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    chunk_workers = workers if split else None
+    jobs = [(path, report_type, output_dir, cache, state_dir, failure_format, compress, chunk_workers, instrumented)
+            for path in report_paths]
+    if workers > 1 and len(jobs) > 1 and not split:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        try:
+            results = pool.map(_run_report_job, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_run_report_job(job) for job in jobs]
+    summaries = []
+    for summary, snapshot in results:
+        summaries.append(summary)
+        if snapshot is not None:
+            metrics.merge(snapshot)
+    fields = ['report', 'type', 'status', 'items', 'findings', 'seconds', 'output', 'error']
+    with open(os.path.join(output_dir, "summary.csv"), 'wb') as summary_file:
+        writer = csv.DictWriter(summary_file, fields, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(summaries)
+    return summaries
+
+
+def _ignore_interrupts():
+    """pool initializer: leaves Ctrl-C to the watcher, which drains the workers itself"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class InboxWatcher(object):
+    """Service that polls inbox for .csv and .txt reports and runs each through run_report on a pool of workers once
+    it is fully written, i.e. its size and modification time have not changed for settle seconds.  A ready report is
+    renamed into inbox/.processing/<arrival time>/ and its outputs go to output_dir/<arrival time>/, so same-named
+    reports don't collide while incremental state is still kept per report name.  When its run finishes it is moved to
+    done_dir or failed_dir, prefixed with its arrival time; those may be on another filesystem, and a report that can't
+    be moved is logged and left in .processing.  At most queue_size reports are in flight; beyond that, new ones
+    are left in the inbox until a worker frees up.  stop(), SIGINT or SIGTERM stop the intake and let the reports in
+    flight finish.  Every report's summary is appended to watch_log.csv in output_dir along with its latency: seconds
+    from first being seen in the inbox to being moved out, and how long of that it spent waiting for a worker"""
+
+    log_fields = ['report', 'type', 'status', 'items', 'findings', 'seconds', 'waited', 'latency', 'output', 'error']
+
+    def __init__(self, inbox, output_dir, done_dir=None, failed_dir=None, workers=None, queue_size=None,
+                 poll_interval=2.0, settle=5.0, cache=None, state_dir=None):
+        self.inbox = inbox
+        self.output_dir = output_dir
+        self.done_dir = done_dir or os.path.join(inbox, "done")
+        self.failed_dir = failed_dir or os.path.join(inbox, "failed")
+        self.processing_dir = os.path.join(inbox, ".processing")
+        self.workers = workers or multiprocessing.cpu_count()
+        self.queue_size = queue_size or 2 * self.workers
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.cache = cache
+        self.state_dir = state_dir
+        self.processed = 0
+        self.failed = 0
+        self._stopping = False
+        self._seen = {}
+        self._pending = []
+        for directory in (output_dir, self.done_dir, self.failed_dir, self.processing_dir):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    def stop(self, *signal_args):
+        self._stopping = True
+
+    def run(self, once=False):
+        """watches the inbox until stopped, or with once, until it has no reports left and none are in flight"""
+        handlers = {}
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            handlers[signum] = signal.signal(signum, self.stop)
+        pool = multiprocessing.Pool(self.workers, _ignore_interrupts)
+        try:
+            while True:
+                self._collect()
+                waiting = 0
+                if not self._stopping:
+                    waiting = self._scan(pool)
+                if not self._pending and (self._stopping or (once and not waiting)):
+                    break
+                time.sleep(self.poll_interval)
+        finally:
+            pool.close()
+            pool.join()
+            self._collect()
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        return self.failed
+
+    def _scan(self, pool):
+        """submits the inbox reports that have settled, while there is room in the queue.  Returns how many reports
+        are still waiting in the inbox"""
+        now = time.time()
+        waiting = 0
+        names = sorted(name for name in os.listdir(self.inbox)
+                       if os.path.splitext(name)[1].lower() in (".csv", ".txt"))
+        for name in names:
+            path = os.path.join(self.inbox, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            seen = self._seen.get(path)
+            if seen is None or seen[0] != signature:
+                self._seen[path] = (signature, now, seen[2] if seen is not None else now)
+                waiting += 1
+                continue
+            if now - seen[1] < self.settle or len(self._pending) >= self.queue_size:
+                waiting += 1
+                continue
+            arrival = time.strftime("%Y%m%d-%H%M%S")
+            processing = os.path.join(self.processing_dir, arrival, name)
+            output_dir = os.path.join(self.output_dir, arrival)
+            for directory in (os.path.dirname(processing), output_dir):
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+            try:
+                os.rename(path, processing)
+            except OSError:
+                # still locked by the writer on some platforms; try again next poll
+                waiting += 1
+                continue
+            del self._seen[path]
+            job = (processing, 'auto', output_dir, self.cache, self.state_dir)
+            self._pending.append((processing, seen[2], time.time(), pool.apply_async(_run_timed_report, (job,))))
+        for path in list(self._seen):
+            if not os.path.exists(path):
+                del self._seen[path]
+        return waiting
+
+    def _collect(self):
+        """moves the reports whose runs have finished to done or failed and logs them"""
+        still_pending = []
+        finished = []
+        for entry in self._pending:
+            if entry[3].ready():
+                finished.append(entry)
+            else:
+                still_pending.append(entry)
+        self._pending = still_pending
+        for processing, first_seen, queued, result in finished:
+            try:
+                summary, started = result.get()
+            except Exception as error:
+                summary = {'report': processing, 'type': 'auto', 'status': 'failed', 'items': 0, 'findings': 0,
+                           'output': '', 'seconds': 0.0, 'error': "{}: {}".format(type(error).__name__, error)}
+                started = queued
+            arrival_dir, name = os.path.split(processing)
+            destination = os.path.join(self.done_dir if summary['status'] == 'ok' else self.failed_dir,
+                                       "{}_{}".format(os.path.basename(arrival_dir), name))
+            try:
+                shutil.move(processing, destination)
+            except (IOError, OSError) as error:
+                # left in .processing rather than letting one report stop the service
+                destination = processing
+                summary['error'] = "{} could not be moved out: {}: {}".format(
+                    summary['error'], type(error).__name__, error).strip()
+            else:
+                try:
+                    os.rmdir(arrival_dir)
+                except OSError:
+                    pass
+            summary['report'] = destination
+            summary['waited'] = round(max(started - queued, 0.0), 3)
+            summary['latency'] = round(time.time() - first_seen, 3)
+            self.processed += 1
+            if summary['status'] != 'ok':
+                self.failed += 1
+            self._log(summary)
+
+    def _log(self, summary):
+        log_path = os.path.join(self.output_dir, "watch_log.csv")
+        new = not os.path.exists(log_path)
+        with open(log_path, 'ab') as log_file:
+            writer = csv.DictWriter(log_file, self.log_fields, extrasaction='ignore', lineterminator='\n')
+            if new:
+                writer.writeheader()
+            writer.writerow(summary)
+        print "{status:6} {report} - {items} items, {findings} findings in {seconds}s, {latency}s after arrival " \
+              "{error}".format(**summary)
+
+
+def _run_timed_report(job):
+    """runs one watched report, returning its summary and when the worker picked it up"""
+    started = time.time()
+    return run_report(*job), started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless SODDA report analysis")
+    commands = parser.add_subparsers(dest='command')
+    batch = commands.add_parser('batch', help="analyze a directory or glob of reports in parallel")
+    batch.add_argument('paths', nargs='+', help="report files, directories or glob patterns")
+    batch.add_argument('-t', '--type', default='auto', choices=tuple(REPORT_REGISTRY) + ('auto',),
+                       help="report type of every input (default: detect each report's type from its contents)")
+    batch.add_argument('-o', '--output-dir', default='sodda_output', help="where per-report outputs and summary.csv go")
+    batch.add_argument('-j', '--workers', type=int, default=None, help="worker processes (default: one per core)")
+    batch.add_argument('--cache-dir', default=None, help="reuse parsed reports cached in this directory")
+    batch.add_argument('--cache-size-mb', type=int, default=1024, help="evict least recently used cache entries beyond this")
+    batch.add_argument('--rebuild-cache', action='store_true', help="re-parse every report and overwrite its cache entry")
+    batch.add_argument('--state-dir', default=None,
+                       help="analyze Subpoint reports incrementally against the previous run's state kept here")
+    batch.add_argument('--format', default='csv', choices=FailureWriter.formats,
+                       help="how Subpoint findings are written (default: csv)")
+    batch.add_argument('--gzip', action='store_true', help="gzip Subpoint findings")
+    batch.add_argument('--split', action='store_true',
+                       help="run reports one at a time, splitting each Subpoint report across the workers")
+    batch.add_argument('--metrics', default=None,
+                       help="record stage timings and counters and write them here (Prometheus text if it ends in "
+                            ".prom, JSON otherwise)")
+    index = commands.add_parser('index', help="add the points of reports to a SQLite point index")
+    index.add_argument('database', help="the point index, created if it doesn't exist")
+    index.add_argument('paths', nargs='+', help="report files, directories or glob patterns")
+    index.add_argument('-t', '--type', default='auto', choices=tuple(REPORT_REGISTRY) + ('auto',),
+                       help="report type of every input (default: detect each report's type from its contents)")
+    query = commands.add_parser('query', help="print the indexed points matching every given criterion as CSV")
+    query.add_argument('database', help="a point index built by the index command")
+    for field in PointIndex.fields + ('report_type',):
+        option = field.replace('_', '-')
+        query.add_argument('--' + option, dest=field, default=None, help="points whose {} is this".format(field))
+        query.add_argument('--not-' + option, dest='not_' + field, default=None,
+                           help="points whose {} is not this".format(field))
+    query.add_argument('--latest', action='store_true', help="only look at the latest snapshot of each report")
+    query.add_argument('--limit', type=int, default=None, help="print at most this many points")
+    query.add_argument('--devices', action='store_true', help="print the matching devices instead of the points")
+    history = commands.add_parser('history', help="keep and query a history of Panel Point Log snapshots")
+    history.add_argument('directory', help="where the history is kept, created if it doesn't exist")
+    history.add_argument('--add', nargs='+', default=[], metavar='PATH',
+                         help="Panel Point Log reports, directories or glob patterns to append as snapshots")
+    history.add_argument('--out-of-auto', type=int, default=None, metavar='N',
+                         help="list points out of automatic for the latest N or more snapshots")
+    history.add_argument('--out-of-normal', type=int, default=None, metavar='N',
+                         help="list points not in normal status for the latest N or more snapshots")
+    history.add_argument('--flapping', type=int, default=None, metavar='N',
+                         help="list points whose status changed N or more times")
+    history.add_argument('--last', type=int, default=None, help="only look at the last this many snapshots")
+    watch = commands.add_parser('watch', help="process reports as they arrive in an inbox directory")
+    watch.add_argument('inbox', help="the directory reports are dropped into")
+    watch.add_argument('-o', '--output-dir', default='sodda_output', help="where per-report outputs and watch_log.csv go")
+    watch.add_argument('--done-dir', default=None, help="where processed reports are moved (default: INBOX/done)")
+    watch.add_argument('--failed-dir', default=None, help="where reports that failed are moved (default: INBOX/failed)")
+    watch.add_argument('-j', '--workers', type=int, default=None, help="worker processes (default: one per core)")
+    watch.add_argument('--queue-size', type=int, default=None,
+                       help="most reports in flight at once (default: twice the workers)")
+    watch.add_argument('--poll', type=float, default=2.0, help="seconds between inbox scans")
+    watch.add_argument('--settle', type=float, default=5.0,
+                       help="seconds a report must go unchanged before it is considered fully written")
+    watch.add_argument('--cache-dir', default=None, help="reuse parsed reports cached in this directory")
+    watch.add_argument('--state-dir', default=None,
+                       help="analyze Subpoint reports incrementally against the previous run's state kept here")
+    watch.add_argument('--once', action='store_true', help="exit once the inbox is empty instead of watching it")
+    xref = commands.add_parser('xref', help="list the PPCL lines that refer to points a Panel Point Log flags")
+    xref.add_argument('index', help="an xref.json written next to converted PPCL programs")
+    xref.add_argument('point_log', help="a Panel Point Log report")
+    xref.add_argument('--category', default='Not in Auto', choices=('Not in Auto', 'Not in Normal'),
+                      help="which Point Log finding to look up (default: Not in Auto)")
+    correlate = commands.add_parser('correlate', help="join Subpoint, Point Log and Point Data Sorter reports and list "
+                                                      "where they disagree")
+    correlate.add_argument('paths', nargs='+', help="report files, directories or glob patterns")
+    correlate.add_argument('--panel', default=None,
+                           help="the field panel the Point Logs were taken from, to join them to Point Data Sorter "
+                                "points by address as well as by name")
+    correlate.add_argument('-o', '--output', default=None,
+                           help="where the findings go, as CSV or JSON Lines by extension (default: CSV on stdout)")
+    args = parser.parse_args(argv)
+    if args.command == 'correlate':
+        return _correlate_reports(args)
+    if args.command == 'xref':
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerow(['point', 'program', 'line', 'kind'])
+        writer.writerows(PPCLIndex.load(args.index).join(PanelPointLogReport(args.point_log), args.category))
+        return 0
+    if args.command == 'watch':
+        cache = None
+        if args.cache_dir is not None:
+            cache = ParseCache(args.cache_dir)
+        watcher = InboxWatcher(args.inbox, args.output_dir, args.done_dir, args.failed_dir, args.workers,
+                               args.queue_size, args.poll, args.settle, cache, args.state_dir)
+        return 1 if watcher.run(args.once) else 0
+    if args.command == 'history':
+        return _point_log_history(args)
+    if args.command == 'index':
+        return _index_reports(args)
+    if args.command == 'query':
+        return _query_index(args)
+    if args.split and args.state_dir is not None:
+        parser.error("--split can't be combined with --state-dir")
+    cache = None
+    if args.cache_dir is not None:
+        cache = ParseCache(args.cache_dir, args.cache_size_mb << 20, args.rebuild_cache)
+    report_paths = find_reports(args.paths)
+    summaries = run_batch(report_paths, args.type, args.output_dir, args.workers, cache, args.state_dir, args.format,
+                          args.gzip, args.metrics is not None, args.split)
+    if args.metrics is not None:
+        metrics.dump(args.metrics)
+    failed = 0
+    for summary in summaries:
+        print "{status:6} {report} - {items} items, {findings} findings in {seconds}s {error}".format(**summary)
+        if summary['status'] != 'ok':
+            failed += 1
+    return 1 if failed else 0
+
+
+def _index_reports(args):
+    failed = 0
+    with PointIndex(args.database) as point_index:
+        for report_path in find_reports(args.paths):
+            start = time.time()
+            try:
+                count = point_index.add_report(report_path, None if args.type == 'auto' else args.type)
+            except Exception as error:
+                print "failed {} - {}: {}".format(report_path, type(error).__name__, error)
+                failed += 1
+            else:
+                print "ok     {} - {} points in {}s".format(report_path, count, round(time.time() - start, 3))
+    return 1 if failed else 0
+
+
+def _correlate_reports(args):
+    correlator = PointCorrelator()
+    failed = 0
+    for report_path in find_reports(args.paths):
+        try:
+            correlator.add_report(report_path, panel=args.panel)
+        except Exception as error:
+            print >> sys.stderr, "failed {} - {}: {}".format(report_path, type(error).__name__, error)
+            failed += 1
+    correlator.correlate()
+    correlator.dump_analysis(args.output if args.output is not None else sys.stdout)
+    return 1 if failed else 0
+
+
+def _point_log_history(args):
+    point_history = PointLogHistory(args.directory)
+    failed = 0
+    for report_path in find_reports(args.add):
+        try:
+            count = point_history.add_report(report_path)
+        except Exception as error:
+            print "failed {} - {}: {}".format(report_path, type(error).__name__, error)
+            failed += 1
+        else:
+            print "ok     {} - {} points".format(report_path, count)
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    if args.out_of_auto is not None:
+        for name, snapshots in point_history.out_of_auto(args.out_of_auto, last=args.last):
+            writer.writerow(['Not in Auto', name, snapshots])
+    if args.out_of_normal is not None:
+        for name, snapshots in point_history.out_of_normal(args.out_of_normal, last=args.last):
+            writer.writerow(['Not in Normal', name, snapshots])
+    if args.flapping is not None:
+        for name, changes in point_history.flapping(args.flapping, args.last):
+            writer.writerow(['Flapping', name, changes])
+    return 1 if failed else 0
+
+
+def _query_index(args):
+    criteria = {}
+    for field in PointIndex.fields + ('report_type',):
+        criteria[field] = getattr(args, field)
+        criteria['not_' + field] = getattr(args, 'not_' + field)
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    with PointIndex(args.database) as point_index:
+        if args.devices:
+            for device in point_index.devices(args.latest, **criteria):
+                writer.writerow([device])
+        else:
+            writer.writerow(IndexedPoint._fields)
+            writer.writerows(point_index.query(args.latest, args.limit, **criteria))
+    return 0
 
 
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,368 @@
+"""Synthetic-data benchmarks for every SODDA report type.
+
+Each report format is written by a deterministic generator, then parsed and analyzed through run_report (the same path
+batch uses) in a fresh worker process, so that process's peak RSS belongs to that one case.  Results go to a JSON file
+that a later run can be compared against:
+
+    python sodda_bench.py -o bench.json
+    python sodda_bench.py -s 1000 10000 -t subpoint --compare bench.json
+
+--check instead analyzes one Subpoint report serially, with FaultEngine, split across workers and from a warm
+ParseCache, and fails if their findings differ or if PointLogHistory answers wrongly when empty:
+
+    python sodda_bench.py --check
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import os.path
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import sodda
+
+__author__ = 'Lincoln Lorscheider'
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+# the report types there are generators for
+REPORT_TYPES = ('subpoint', 'pointlog', 'ppcl', 'pointdata')
+
+# extra headers real Point Data Sorter exports carry that PointDataSorter.columns doesn't map, padding the header to 60
+_EXTRA_POINT_DATA_HEADERS = ('Revision Number', 'Last Modified')
+
+
+def _status_priority(rng, separator):
+    status = sodda.Point.failed if rng.random() < 0.02 else sodda.Point.normal
+    priority = rng.choice(("NONE", "NONE", "NONE", "NONE", "OPER", "OVRD"))
+    return status + separator + priority
+
+
+def write_subpoint_report(path, points, seed=0):
+    """writes an Application Subpoint CSV of TEC blocks holding about points subpoints in total, with the
+    "status    priority" column and faults of every kind TEC.analyze looks for.  Returns the subpoint count"""
+    rng = random.Random(seed)
+    written = 0
+    with open(path, 'wb') as report_file:
+        writer = csv.writer(report_file, lineterminator='\r\n')
+        writer.writerow(["Application Subpoint Report"])
+        number = 0
+        while written < points:
+            number += 1
+            tec = "B{}.TEC{:05d}".format(number % 7 + 1, number)
+            writer.writerow(["TEC System Name:", tec, "", "Descriptor:", "ROOM {} VAV".format(number), "", ""])
+            application = rng.choice((2021, 2021, 2021, 2022, 2090))
+            stpt = round(rng.uniform(68, 76), 1)
+            flow_stpt = round(rng.uniform(20, 100), 1)
+            occ_flow = rng.choice((0.0, 400.0, 600.0, 800.0))
+            sup_damper = rng.choice((0.0, 45.0, 90.0, 100.0))
+            subpoints = [
+                ("ADDRESS", number % 99 + 1, ""),
+                ("APPLICATION", application, ""),
+                ("ROOM TEMP", round(stpt + rng.gauss(0, 2), 1), "DEG F"),
+                ("CTL TEMP", round(stpt + rng.gauss(0, 3), 1), "DEG F"),
+                ("CTL STPT", stpt, "DEG F"),
+                ("FLOW", round(flow_stpt + rng.gauss(0, 15), 1), "PCT"),
+                ("FLOW STPT", flow_stpt, "PCT"),
+                ("OCC FLOW", occ_flow, "CFM"),
+                ("UNOCC FLOW", rng.choice((0.0, 200.0, 900.0)), "CFM"),
+                ("SUP AIR VOL", round(rng.uniform(0, 900) if sup_damper else rng.choice((0.0, 40.0)), 1), "CFM"),
+                ("SUP DMP CMD", sup_damper, "PCT"),
+                ("GEX AIR VOL", round(rng.uniform(100, 900), 1), "CFM"),
+                ("GEX DMP CMD", rng.choice((30.0, 60.0, 95.0)), "PCT"),
+                ("LOOPOUT", round(rng.uniform(0, 100), 1), "PCT"),
+                ("HEAT.COOL", rng.choice(("HEAT", "COOL")), ""),
+                ("DAY.NGT", rng.choice(("DAY", "NIGHT")), ""),
+            ]
+            for address, (name, value, units) in enumerate(subpoints, 1):
+                writer.writerow([address, "{}:{}".format(tec, name), "", "", value, units,
+                                 _status_priority(rng, "    ")])
+            written += len(subpoints)
+        writer.writerow(["*" * 40])
+    return written
+
+
+def write_point_log(path, points, seed=0):
+    """writes a Panel Point Log CSV of points points, one in twenty split into a name-only row followed by an
+    "aberration" continuation row whose first cell is empty.  Returns the point count"""
+    rng = random.Random(seed)
+    with open(path, 'wb') as report_file:
+        writer = csv.writer(report_file, lineterminator='\r\n')
+        for number in range(points):
+            name = "B{}.AHU{:03d}.PT{:06d}".format(number % 7 + 1, number % 250, number)
+            fields = [str(number % 4096), "POINT {}".format(number), str(round(rng.uniform(0, 100), 2)),
+                      rng.choice(("DEG F", "PCT", "CFM", "")), _status_priority(rng, "  ")]
+            if number % 20 == 19:
+                writer.writerow([name + ".LONG.SYSTEM.NAME"])
+                writer.writerow([""] + fields)
+            else:
+                writer.writerow([name, ""] + fields)
+    return points
+
+
+def write_ppcl_report(path, points, seed=0):
+    """writes a Panel PPCL .txt dump of points numbered lines in programs of about a hundred, with a continuation line
+    after one in eight of them.  Returns the numbered line count"""
+    rng = random.Random(seed)
+    with open(path, 'wb') as report_file:
+        report_file.write("Panel PPCL Report\r\n\r\n")
+        for number in range(points):
+            if number % 100 == 0:
+                report_file.write("\r\nProgram Name: B{}.PRG{:05d}\r\n\r\n".format(number % 7 + 1, number // 100))
+            linenumber = (number % 100 + 1) * 10
+            state = rng.choice(("U", "E", "UT", "D"))
+            point = "RM{:05d}.TEMP".format(rng.randrange(100000))
+            report_file.write("{:<2}    {:05d}   IF(\"{}\" .GT. {:.1f}) THEN ON(\"AHU{}.SF\")".format(
+                state, linenumber, point, rng.uniform(65, 80), number % 40))
+            if number % 8 == 7:
+                report_file.write("\r\n             ELSE OFF(\"AHU{}.SF\")".format(number % 40))
+            report_file.write("\r\n")
+    return points
+
+
+def write_point_data(path, points, seed=0):
+    """writes a Point Data Sorter CSV with its title line, the 60-column header and trailer, one in fifty points
+    having a System Name that doesn't match its Name.  Returns the point count"""
+    rng = random.Random(seed)
+    header = []
+    for _, name in sodda.PointDataSorter.columns:
+        if name not in header:
+            header.append(name)
+    header.extend(_EXTRA_POINT_DATA_HEADERS)
+    with open(path, 'wb') as report_file:
+        report_file.write("Point Data Sorter Report\r\n")
+        writer = csv.writer(report_file, lineterminator='\r\n')
+        writer.writerow(header)
+        for number in range(points):
+            name = "B{}.AHU{:03d}.PT{:06d}".format(number % 7 + 1, number % 250, number)
+            row = dict((column, "") for column in header)
+            row.update({'Panel Name': "PANEL{:03d}".format(number % 64), 'Point Address': str(number % 4096),
+                        'Name': name, 'System Name': name + ".OLD" if rng.random() < 0.02 else name,
+                        'Descriptor': "POINT {}".format(number), 'Priority': rng.choice(("NONE", "OPER")),
+                        'Point Type': rng.choice(("LAI", "LAO", "LDI", "LDO")),
+                        'Engineering Units': rng.choice(("DEG F", "PCT", "CFM")),
+                        'Low Alarm Limit': "55.0", 'High Alarm Limit': "85.0", 'Slope': "1.0", 'Intercept': "0.0",
+                        'COV Limit': "0.5", 'Alarmable': rng.choice(("Yes", "No")), '# of decimal places': "1"})
+            writer.writerow([row[column] for column in header])
+        writer.writerow(["{} points".format(points)])
+    return points
+
+
+# report type: (generator, file extension)
+GENERATORS = {'subpoint': (write_subpoint_report, ".csv"), 'pointlog': (write_point_log, ".csv"),
+              'ppcl': (write_ppcl_report, ".txt"), 'pointdata': (write_point_data, ".csv")}
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+def _run_case(job):
+    """runs one report through run_report in this worker process"""
+    report_path, report_type, output_dir, cache_dir = job
+    cache = None
+    if cache_dir is not None:
+        cache = sodda.ParseCache(cache_dir)
+    start = time.time()
+    summary = sodda.run_report(report_path, report_type, output_dir, cache)
+    seconds = time.time() - start
+    return summary, seconds, _peak_rss_kb()
+
+
+def run_case(report_type, points, data_dir, output_dir, seed=0, cache_dir=None):
+    """generates (or reuses) the synthetic report for report_type at points points under data_dir, then parses and
+    analyzes it in a fresh process.  Returns a result dict"""
+    generate, extension = GENERATORS[report_type]
+    report_path = os.path.join(data_dir, "{}_{}_{}{}".format(report_type, points, seed, extension))
+    count_path = report_path + ".count"
+    if os.path.exists(report_path) and os.path.exists(count_path):
+        with open(count_path) as count_file:
+            count = int(count_file.read())
+    else:
+        count = generate(report_path, points, seed)
+        with open(count_path, 'w') as count_file:
+            count_file.write(str(count))
+    size = os.path.getsize(report_path)
+    pool = multiprocessing.Pool(1)
+    try:
+        summary, seconds, peak_rss_kb = pool.apply(_run_case, ((report_path, report_type, output_dir, cache_dir),))
+    finally:
+        pool.close()
+        pool.join()
+    seconds = max(seconds, 1e-9)
+    return {'type': report_type, 'points': count, 'bytes': size, 'status': summary['status'],
+            'error': summary['error'], 'items': summary['items'], 'findings': summary['findings'],
+            'seconds': round(seconds, 4), 'points_per_sec': round(count / seconds, 1),
+            'mb_per_sec': round(size / seconds / (1 << 20), 3), 'peak_rss_kb': peak_rss_kb}
+
+
+def run_suite(report_types=REPORT_TYPES, sizes=SIZES, data_dir=None, seed=0, cache_dir=None, progress=None):
+    """runs run_case for every report type at every size, smallest first.  Generated reports are kept in data_dir if
+    one is given and reused by later runs; otherwise they go to a temporary directory that is removed afterwards"""
+    temp_dir = tempfile.mkdtemp(prefix="sodda_bench_")
+    if data_dir is None:
+        data_dir = temp_dir
+    elif not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+    results = []
+    try:
+        for points in sorted(sizes):
+            for report_type in report_types:
+                output_dir = os.path.join(temp_dir, "{}_{}".format(report_type, points))
+                os.makedirs(output_dir)
+                result = run_case(report_type, points, data_dir, output_dir, seed, cache_dir)
+                results.append(result)
+                shutil.rmtree(output_dir)
+                if progress is not None:
+                    progress(result)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'machine': platform.machine(),
+            'cpus': multiprocessing.cpu_count(), 'parser_version': sodda.PARSER_VERSION,
+            'rules_version': sodda.RULES_VERSION, 'seed': seed, 'cached': cache_dir is not None,
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"), 'results': results}
+
+
+def check_equivalence(points=20000, seed=0, workers=4):
+    """analyzes one synthetic Subpoint report every way sodda offers and returns [(way, TEC name)] for each TEC whose
+    findings differ from the serial analyze_tecs run, or [(way, None)] when a way yields different TECs altogether.
+    The ways are FaultEngine, the report split across workers (in byte ranges small enough that every worker gets
+    some) and a warm ParseCache.  An empty list means they all agree"""
+    directory = tempfile.mkdtemp(prefix="sodda_check_")
+    try:
+        report_path = os.path.join(directory, "subpoint.csv")
+        write_subpoint_report(report_path, points, seed)
+        serial = _analyzed(sodda.SubpointReport(report_path, analyze=False))
+        engine = sodda.FaultEngine(sodda.SubpointReport(report_path, analyze=False).iter_TECs()).analyze()
+        size = os.path.getsize(report_path)
+        split = [(name, failures, rules) for name, _, failures, rules in
+                 sodda._analyze_subpoint_chunks(report_path, workers, size // (workers * 4) or 1)]
+        cache = sodda.ParseCache(os.path.join(directory, "cache"))
+        _analyzed(sodda.SubpointReport(report_path, cache=cache, analyze=False))
+        warm = sodda.SubpointReport(report_path, cache=cache, analyze=False)
+        if warm._cached is None:
+            return [('cache', None)]
+        mismatches = []
+        for way, results in (('faultengine', [(name, failures, None) for name, failures in engine]),
+                             ('split', split), ('cache', _analyzed(warm))):
+            if [result[0] for result in results] != [result[0] for result in serial]:
+                mismatches.append((way, None))
+                continue
+            for expected, (name, failures, rules) in zip(serial, results):
+                if failures != expected[1] or (rules is not None and rules != expected[2]):
+                    mismatches.append((way, name))
+        return mismatches
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def check_history(points=1000, seed=0):
+    """queries a PointLogHistory while it is empty, then with one synthetic Point Log added, and returns a description
+    of every query whose answer is wrong: nothing is out of auto, out of normal or flapping in an empty history or over
+    last=0 snapshots, and one snapshot's out-of-auto points are the ones PanelPointLogReport finds"""
+    directory = tempfile.mkdtemp(prefix="sodda_check_")
+    try:
+        history = sodda.PointLogHistory(os.path.join(directory, "history"))
+        problems = []
+        for query in ('out_of_auto', 'out_of_normal', 'flapping'):
+            if getattr(history, query)(1):
+                problems.append("{} on an empty history".format(query))
+        report_path = os.path.join(directory, "pointlog.csv")
+        write_point_log(report_path, points, seed)
+        history.add_report(report_path)
+        for query in ('out_of_auto', 'out_of_normal', 'flapping'):
+            if getattr(history, query)(1, last=0):
+                problems.append("{} over last=0 snapshots".format(query))
+        expected = set(sodda.PanelPointLogReport(report_path).analysis.get('Not in Auto', []))
+        if set(name for name, _ in history.out_of_auto(1)) != expected:
+            problems.append("out_of_auto differs from PanelPointLogReport")
+        return problems
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _analyzed(report):
+    """[(TEC name, failures, rules)] for every TEC of report, analyzed one at a time"""
+    results = []
+    for tec in report.iter_TECs():
+        tec.analyze()
+        results.append((tec.name, tec.failures, tec.failure_rules))
+    return results
+
+
+def compare(baseline, current):
+    """pairs each current result with the baseline result of the same type and size.  Returns a list of
+    (type, points, seconds ratio, peak RSS ratio); a ratio above 1 means the current run is slower or larger"""
+    previous = dict(((result['type'], result['points']), result) for result in baseline['results'])
+    ratios = []
+    for result in current['results']:
+        old = previous.get((result['type'], result['points']))
+        if old is None:
+            continue
+        seconds = result['seconds'] / max(old['seconds'], 1e-9)
+        rss = None
+        if result['peak_rss_kb'] and old['peak_rss_kb']:
+            rss = float(result['peak_rss_kb']) / old['peak_rss_kb']
+        ratios.append((result['type'], result['points'], seconds, rss))
+    return ratios
+
+
+def _print_result(result):
+    print "{type:9} {points:>8} points {seconds:>9.3f}s {points_per_sec:>11.0f} points/s {mb_per_sec:>8.2f} MB/s " \
+          "peak {peak_rss_kb} KB {status} {error}".format(**result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark SODDA report parsing and analysis on synthetic reports")
+    parser.add_argument('-t', '--type', dest='types', nargs='+', choices=REPORT_TYPES,
+                        default=list(REPORT_TYPES), help="report types to benchmark (default: all)")
+    parser.add_argument('-s', '--sizes', nargs='+', type=int, default=list(SIZES), help="points per report")
+    parser.add_argument('-o', '--output', default='sodda_bench.json', help="where to write the JSON results")
+    parser.add_argument('--data-dir', default=None, help="keep generated reports here and reuse them on later runs")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the synthetic report generators")
+    parser.add_argument('--cache-dir', default=None, help="read reports through a ParseCache kept in this directory")
+    parser.add_argument('--compare', default=None, help="a previous results file to compare this run against")
+    parser.add_argument('--check', action='store_true',
+                        help="instead of benchmarking, check that every way of analyzing a Subpoint report agrees and "
+                             "that an empty PointLogHistory answers correctly")
+    args = parser.parse_args(argv)
+    if args.check:
+        mismatches = check_equivalence(seed=args.seed)
+        for way, name in mismatches:
+            print "{:12} differs from analyze_tecs {}".format(way, "for " + name if name else "in its TECs")
+        problems = check_history(seed=args.seed)
+        for problem in problems:
+            print "history      wrong answer from {}".format(problem)
+        print "{} mismatches".format(len(mismatches) + len(problems))
+        return 1 if mismatches or problems else 0
+    report = run_suite(args.types, args.sizes, args.data_dir, args.seed, args.cache_dir, _print_result)
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2, sort_keys=True)
+    failed = [result for result in report['results'] if result['status'] != 'ok']
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        for report_type, points, seconds, rss in compare(baseline, report):
+            print "{:9} {:>8} points  time x{:.2f}  peak RSS {}".format(
+                report_type, points, seconds, "n/a" if rss is None else "x{:.2f}".format(rss))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())